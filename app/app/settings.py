@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_spectacular',
     'rest_framework.authtoken',
@@ -141,6 +143,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'  # get_user_model will referrer to this
 
+# Token revocation (core/authentication.py) and the response cache
+# generations (recipe/cache.py) live in the default cache, so it has to be
+# shared by every worker: set REDIS_URL. The in-process cache is only used
+# when it is unset and by the test suite, which clears it between tests.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL and sys.argv[1:2] != ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+TOKEN_AUTH_CACHE = {   # see core/authentication.py
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_SIZE': 1024,
+    'LOCAL_TTL': 60,
+    'SHARED_TTL': 300,
+}
+
+RESPONSE_CACHE = {   # see recipe/cache.py
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,
+    'LOCK_TTL': 10,
+    'LOCK_WAIT': 5,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -151,4 +187,45 @@ SPECTACULAR_SETTINGS = {
 
 # drf_spectacular is an extension for Django REST Framework (DRF)
 # that provides more advanced and comprehensive capabilities for generating
-# API schema definitions, which can be used for documentation.
\ No newline at end of file
+# API schema definitions, which can be used for documentation.
+IMAGE_VARIANTS = {   # see recipe/images.py
+    'SIZES': (128, 512, 1024),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+IMAGE_UPLOADS = {   # see recipe/uploads.py
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 24_000_000,
+    'MAX_SIDE': 2048,
+    'FORMATS': ('JPEG', 'PNG', 'WEBP'),
+    'QUALITY': 90,
+}
+
+# recipe images are stored once per distinct content, see core/storage.py;
+# 'core.s3.S3Storage' keeps them in the S3_STORAGE bucket instead
+RECIPE_IMAGE_STORAGE = os.environ.get(
+    'RECIPE_IMAGE_STORAGE', 'core.storage.ContentAddressedStorage',
+)
+# levels of two hex digit directories new recipe images are spread over,
+# 0 for the flat layout; shard_recipe_images moves existing images
+RECIPE_IMAGE_SHARD_LEVELS = 2
+
+S3_STORAGE = {   # see core/s3.py
+    'BUCKET': os.environ.get('S3_BUCKET', ''),
+    'ENDPOINT_URL': os.environ.get('S3_ENDPOINT_URL') or None,
+    'REGION': os.environ.get('S3_REGION') or None,
+    'ACCESS_KEY': os.environ.get('S3_ACCESS_KEY') or None,
+    'SECRET_KEY': os.environ.get('S3_SECRET_KEY') or None,
+    'PART_SIZE': 8 * 1024 * 1024,
+    'URL_EXPIRES': 60 * 60,
+}
+
+MEDIA_SERVING = {   # see recipe/media.py
+    # 'x-accel-redirect' behind nginx, 'x-sendfile' behind Apache
+    'OFFLOAD': os.environ.get('MEDIA_OFFLOAD') or None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 365 * 24 * 60 * 60,
+}
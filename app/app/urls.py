@@ -16,7 +16,6 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from django.conf.urls.static import static
 from django.conf import settings
 
 from drf_spectacular.views import (
@@ -24,6 +23,8 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from recipe.media import MediaView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -35,6 +36,12 @@ urlpatterns = [
     ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    # recipe images, served to their owners (see recipe/media.py)
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:name>',
+        MediaView.as_view(),
+        name='media',
+    ),
 ]
 
 # The SpectacularAPIView class in the drf_spectacular package is a Django
@@ -48,10 +55,3 @@ urlpatterns = [
 # This get method is responsible for generating and returning the OpenAPI schema
 # for your API. It does this by examining your API's configuration, gathering metadata
 # about its endpoints, and formatting this metadata according to the OpenAPI specification.
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-    )
-
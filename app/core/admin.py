@@ -48,6 +48,8 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Recipe)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
+admin.site.register(models.RecipeImport)
+admin.site.register(models.ImageBlob)
 
 # what is the orginial fieldsets?
 # if i add a new user in the admin interface,
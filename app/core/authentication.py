@@ -0,0 +1,211 @@
+"""
+Cached token authentication.
+
+DRF's TokenAuthentication joins the token and user tables on every request.
+CachedTokenAuthentication resolves the token in two tiers instead:
+
+1. a bounded in-process LRU holding the resolved user, and
+2. the shared Django cache, so a token resolved by one worker is reused by
+   the others,
+
+and only falls back to the database when both miss.
+
+Every cached entry carries the user's current version, a random value kept
+in the shared cache. Deleting a token (logout, rotation) or saving the user
+(is_active, password, ...) replaces that version, which makes the entries of
+every worker stale at once instead of waiting for their TTLs. A local hit
+therefore still reads that one small value from the shared cache, which is
+far cheaper than the token and user join.
+
+Entries hold only CACHED_USER_FIELDS, never the password hash; the user is
+rebuilt with the other fields deferred, loaded from the database if used.
+"""
+import functools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_SIZE': 1024,   # tokens kept per process
+    'LOCAL_TTL': 60,   # seconds
+    'SHARED_TTL': 300,   # seconds
+}
+# what authentication and the views read off request.user
+CACHED_USER_FIELDS = ('id', 'email', 'name', 'is_active', 'is_staff',
+                      'is_superuser')
+
+
+def get_setting(name):
+    """Return a TOKEN_AUTH_CACHE setting, falling back to the default."""
+    return getattr(settings, 'TOKEN_AUTH_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LocalLRUCache:
+    """Thread-safe, size-bounded LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for key, or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)   # mark as most recently used
+            return value
+
+    def set(self, key, value):
+        """Store value for key, evicting the least recently used entry."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+local_cache = LocalLRUCache(
+    max_size=get_setting('LOCAL_MAX_SIZE'),
+    ttl=get_setting('LOCAL_TTL'),
+)
+
+
+def shared_cache():
+    """Return the shared cache backing the local tier."""
+    return caches[get_setting('CACHE_ALIAS')]
+
+
+def _token_key(key):
+    return f'tokenauth:token:{key}'
+
+
+def _version_key(user_id):
+    return f'tokenauth:version:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return the current version of the user's cached tokens."""
+    cache = shared_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # never set or evicted; a fresh value can't match any old entry
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+
+    return version
+
+
+def invalidate_user_tokens(user_id):
+    """Make every cached token of the user stale, in every process."""
+    shared_cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_user_tokens_on_write(user_id):
+    """Invalidate the user's tokens now and again once the write commits."""
+    invalidate_user_tokens(user_id)
+    # a request racing with the open transaction still finds the old rows
+    # and caches them under the new version, the bump on commit retires it
+    transaction.on_commit(functools.partial(invalidate_user_tokens, user_id))
+
+
+def _user_fields(user):
+    return {name: getattr(user, name) for name in CACHED_USER_FIELDS}
+
+
+def _user_from_fields(fields):
+    """Return a user with fields loaded and every other field deferred."""
+    user_model = get_user_model()
+    # from_db() takes the values in the order of the model's fields
+    names = [
+        field.attname for field in user_model._meta.concrete_fields
+        if field.attname in fields
+    ]
+    return user_model.from_db(
+        router.db_for_read(user_model), names,
+        [fields[name] for name in names],
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication backed by a local LRU and the shared cache."""
+
+    def authenticate_credentials(self, key):
+        """Resolve key to a user, hitting the database only on a miss."""
+        cached = local_cache.get(key)
+        if cached is None:
+            cached = shared_cache().get(_token_key(key))
+            if cached is not None:
+                local_cache.set(key, cached)
+
+        if cached is not None:
+            fields, version = cached
+            if version == get_user_version(fields['id']):
+                # a new instance, a request can't change other requests' user
+                user = _user_from_fields(fields)
+                return (user, Token(key=key, user=user))
+            local_cache.delete(key)
+
+        # read the version before the user so a change committed while we
+        # load it leaves a stale version behind, never a stale user
+        user_id = Token.objects.filter(key=key).values_list(
+            'user_id', flat=True,
+        ).first()
+        version = get_user_version(user_id) if user_id else None
+        user, token = super().authenticate_credentials(key)
+        entry = (_user_fields(user), version)
+        shared_cache().set(
+            _token_key(key),
+            entry,
+            timeout=get_setting('SHARED_TTL'),
+        )
+        local_cache.set(key, entry)
+
+        return (user, token)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Drop a deleted (logged out or rotated) token from both tiers."""
+    local_cache.delete(instance.key)
+    shared_cache().delete(_token_key(instance.key))
+    invalidate_user_tokens_on_write(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    """Re-check is_active and the user data on the next request."""
+    invalidate_user_tokens_on_write(instance.id)
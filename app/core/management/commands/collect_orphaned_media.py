@@ -0,0 +1,82 @@
+"""
+Django command to delete recipe image files no recipe references.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipe.orphans import (
+    DIRECTORY,
+    GRACE,
+    collect_orphans,
+    find_orphans,
+    media_root,
+)
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect orphaned media files."""
+    help = ('Delete files under the recipe image directory that no recipe '
+            'references and that are older than the grace period.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List the orphans without deleting them.',
+        )
+        parser.add_argument(
+            '--grace-hours', type=float,
+            default=GRACE.total_seconds() / 3600,
+            help='Leave files younger than this alone (default: 24).',
+        )
+        parser.add_argument(
+            '--rate', type=float,
+            help='Delete at most this many files per second.',
+        )
+        parser.add_argument(
+            '--directory', default=DIRECTORY,
+            help=f'Media directory to collect (default: {DIRECTORY}).',
+        )
+        parser.add_argument(
+            '--every', type=float,
+            help='Keep running, collecting every this many seconds.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            root = media_root()
+        except NotImplementedError:
+            raise CommandError('Recipe images are not stored on a local '
+                               'file system.')
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError('--rate must be positive.')
+
+        while True:
+            self.collect(root, options)
+            if not options['every']:
+                break
+            connection.close()   # don't hold a connection while sleeping
+            time.sleep(options['every'])
+
+    def collect(self, root, options):
+        """Run one collection."""
+        grace = timedelta(hours=options['grace_hours'])
+
+        def report(name, size):
+            if options['dry_run'] or options['verbosity'] > 1:
+                self.stdout.write(f'{name} ({size} bytes)')
+
+        files, size = collect_orphans(
+            find_orphans(root, options['directory'], grace),
+            dry_run=options['dry_run'],
+            rate=options['rate'],
+            grace=grace,
+            report=report,
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {files} orphaned files, {size} bytes.'
+        ))
@@ -0,0 +1,63 @@
+"""
+Django command to export a user's recipes as NDJSON or CSV.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+
+from recipe.export import (
+    CHUNK_SIZE,
+    FORMATS,
+    export_recipes,
+)
+
+
+class Command(BaseCommand):
+    """Django command to stream a recipe export to a file or stdout."""
+    help = 'Export the recipes of a user with their tags and ingredients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to export.')
+        parser.add_argument(
+            '--type', choices=list(FORMATS), default='ndjson',
+            help='Export format (default: ndjson).',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write to, stdout if omitted.',
+        )
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Gzip the output, requires --output.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Recipes fetched from the database at a time.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}.')
+        if options['gzip'] and not options['output']:
+            raise CommandError('--gzip requires --output.')
+
+        parts = export_recipes(
+            Recipe.objects.filter(user=user),
+            fmt=options['type'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for part in parts:
+                    output.write(part)
+            self.stderr.write(self.style.SUCCESS(
+                f'Exported to {options["output"]}.'
+            ))
+        else:
+            for part in parts:
+                self.stdout.write(part.decode(), ending='')
@@ -0,0 +1,42 @@
+"""
+Django command to generate missing recipe image variants.
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+
+from recipe.images import generate_variants
+
+
+class Command(BaseCommand):
+    """Django command to render image variants in the foreground."""
+    help = 'Generate the resized variants of recipe images lacking them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regenerate the variants of every image, e.g. after the '
+                 'configured sizes or formats changed.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        recipes = Recipe.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        ids = list(recipes.order_by('id').values_list('id', flat=True))
+
+        failed = 0
+        for count, recipe_id in enumerate(ids, 1):
+            try:
+                generate_variants(recipe_id)
+            except Exception as exc:   # a broken image must not stop the run
+                failed += 1
+                self.stderr.write(f'recipe {recipe_id}: {exc}')
+            if count % 100 == 0:
+                self.stdout.write(f'{count}/{len(ids)} images processed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {len(ids) - failed} images, '
+            f'{failed} failed.'
+        ))
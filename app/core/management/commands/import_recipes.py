@@ -0,0 +1,77 @@
+"""
+Django command to bulk import a user's recipes from NDJSON or CSV.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.export import FORMATS
+from recipe.importer import (
+    BATCH_SIZE,
+    ImportConflict,
+    ImportFormatError,
+    import_recipes,
+)
+
+
+class Command(BaseCommand):
+    """Django command to load recipes with COPY, resumable by key."""
+    help = 'Bulk import recipes, with tags and ingredients, for a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to import for.')
+        parser.add_argument(
+            'path',
+            help='NDJSON or CSV file, as written by export_recipes, '
+                 'optionally gzipped.',
+        )
+        parser.add_argument(
+            '--type', choices=list(FORMATS), default='ndjson',
+            help='Input format (default: ndjson).',
+        )
+        parser.add_argument(
+            '--key',
+            help='Import key, rerun with the same key to resume '
+                 '(default: the file path).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Records committed per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}.')
+
+        started = time.monotonic()
+
+        def progress(state):
+            rate = state.imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{state.position} records read, {state.imported} imported, '
+                f'{state.rejected} rejected ({rate:.0f} recipes/s)'
+            )
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                state, errors = import_recipes(
+                    user,
+                    stream,
+                    fmt=options['type'],
+                    key=options['key'] or options['path'],
+                    batch_size=options['batch_size'],
+                    progress=progress,
+                )
+        except (ImportFormatError, ImportConflict, OSError) as exc:
+            raise CommandError(f'Import failed: {exc}')
+
+        for error in errors:
+            self.stderr.write(f'record {error["record"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Import {state.key} finished: {state.imported} imported, '
+            f'{state.rejected} rejected.'
+        ))
@@ -0,0 +1,32 @@
+"""
+Django command to delete old entries of the delta sync change log.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipe.sync import RETENTION, prune_changes
+
+
+class Command(BaseCommand):
+    """Django command to prune the change log."""
+    help = ('Delete change log entries older than the retention period. '
+            'Clients that synced before them get a full sync.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=RETENTION.days,
+            help=f'Days of changes to keep (default: {RETENTION.days}).',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = prune_changes(before)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} changes logged before {before:%Y-%m-%d %H:%M}.'
+        ))
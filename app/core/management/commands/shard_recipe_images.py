@@ -0,0 +1,62 @@
+"""
+Django command to move stored recipe images into the sharded layout.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import shard_levels
+
+from recipe.orphans import media_root
+from recipe.sharding import (
+    BATCH_SIZE,
+    iter_batches,
+    move_batch,
+)
+
+
+class Command(BaseCommand):
+    """Django command to shard the recipe image directory, online."""
+    help = ('Move recipe images, with their variants, into the directory '
+            'layout of RECIPE_IMAGE_SHARD_LEVELS in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--levels', type=int,
+            help='Directory levels (default: RECIPE_IMAGE_SHARD_LEVELS).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Images moved per transaction.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Count the images to move without moving them.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            media_root()
+        except NotImplementedError:
+            raise CommandError('Recipe images are not stored on a local '
+                               'file system.')
+        levels = options['levels']
+        if levels is None:
+            levels = shard_levels()
+        if levels < 0:
+            raise CommandError('--levels must not be negative.')
+
+        found = moved = 0
+        for batch in iter_batches(levels, options['batch_size']):
+            found += len(batch)
+            if not options['dry_run']:
+                moved += move_batch(batch, levels)
+                self.stdout.write(f'{moved}/{found} images moved')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{found} images to move.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Moved {moved} images, {found - moved} skipped.'
+            ))
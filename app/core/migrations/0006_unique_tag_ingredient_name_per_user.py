@@ -0,0 +1,61 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge tags and ingredients a user created twice with the same name."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in [('Tag', 'tags'), ('Ingredient', 'ingredients')]:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        fk = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.values('user_id', 'name')
+            .annotate(keep_id=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for dup in duplicates:
+            drop_ids = list(
+                model.objects.filter(user_id=dup['user_id'], name=dup['name'])
+                .exclude(id=dup['keep_id'])
+                .values_list('id', flat=True)
+            )
+            recipe_ids = set(
+                through.objects.filter(**{f'{fk}__in': drop_ids})
+                .values_list('recipe_id', flat=True)
+            )
+            recipe_ids -= set(
+                through.objects.filter(**{fk: dup['keep_id']})
+                .values_list('recipe_id', flat=True)
+            )
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{fk: dup['keep_id']})
+                for recipe_id in recipe_ids
+            ])
+            model.objects.filter(id__in=drop_ids).delete()
+
+    # the deletes leave deferred foreign key checks pending, and ALTER TABLE
+    # refuses a table with pending trigger events; run the checks now
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:50
+
+from django.db import migrations, models
+
+
+# statement level triggers read the changed rows from a transition table, so
+# a bulk insert of 1,000 rows logs its changes with one INSERT ... SELECT
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_record_change() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_change (user_id, model, object_id, action, txid)
+    SELECT user_id, TG_ARGV[0], id, TG_OP, txid_current() FROM changed_rows;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_record_relation_change() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_change (user_id, model, object_id, action, txid)
+    SELECT DISTINCT r.user_id, 'recipe', r.id, 'UPDATE', txid_current()
+    FROM changed_rows c JOIN core_recipe r ON r.id = c.recipe_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_TRIGGERS = """
+DROP FUNCTION core_record_change() CASCADE;
+DROP FUNCTION core_record_relation_change() CASCADE;
+"""
+
+TRIGGER = """
+CREATE TRIGGER {table}_{op}_change AFTER {op} ON {table}
+REFERENCING {transition} TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION {function}({args});
+"""
+
+
+def trigger_sql(table, function, args='', ops=('INSERT', 'UPDATE', 'DELETE')):
+    """Return the SQL creating a change trigger per operation on table."""
+    return ''.join(
+        TRIGGER.format(
+            table=table,
+            op=op,
+            transition='OLD' if op == 'DELETE' else 'NEW',
+            function=function,
+            args=args,
+        )
+        for op in ops
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_unique_tag_ingredient_name_per_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(max_length=6)),
+                ('txid', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user_id', 'txid', 'id'], name='core_change_user_id_43f06b_idx'),
+        ),
+        migrations.RunSQL(
+            CREATE_TRIGGERS
+            + trigger_sql('core_recipe', 'core_record_change', "'recipe'")
+            + trigger_sql('core_tag', 'core_record_change', "'tag'")
+            + trigger_sql(
+                'core_ingredient', 'core_record_change', "'ingredient'",
+            )
+            + trigger_sql(
+                'core_recipe_tags', 'core_record_relation_change',
+                ops=('INSERT', 'DELETE'),
+            )
+            + trigger_sql(
+                'core_recipe_ingredients', 'core_record_relation_change',
+                ops=('INSERT', 'DELETE'),
+            ),
+            DROP_TRIGGERS,
+        ),
+    ]
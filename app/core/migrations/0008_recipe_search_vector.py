@@ -0,0 +1,141 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:53
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# the document weights the title above tag and ingredient names, and those
+# above the description
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_document(
+    recipe_id bigint, title text, description text
+) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_tag t
+            JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_ingredient i
+            JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+-- title or description written: recompute the row being written
+CREATE FUNCTION core_recipe_search_row() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_document(
+        NEW.id, NEW.title, NEW.description
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search BEFORE INSERT OR UPDATE OF title, description
+ON core_recipe FOR EACH ROW EXECUTE FUNCTION core_recipe_search_row();
+
+-- tags or ingredients attached or detached: recompute those recipes once
+CREATE FUNCTION core_recipe_search_relation() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r
+    SET search_vector = core_recipe_document(r.id, r.title, r.description)
+    WHERE r.id IN (SELECT recipe_id FROM changed_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- tag or ingredient renamed: recompute the recipes using it
+-- TG_ARGV: through table, its column pointing at the renamed table
+CREATE FUNCTION core_recipe_search_rename() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format(
+        'UPDATE core_recipe r
+         SET search_vector = core_recipe_document(r.id, r.title, r.description)
+         WHERE r.id IN (
+             SELECT rel.recipe_id FROM %I rel
+             JOIN new_rows n ON n.id = rel.%I
+             JOIN old_rows o ON o.id = n.id
+             WHERE o.name IS DISTINCT FROM n.name
+         )',
+        TG_ARGV[0], TG_ARGV[1]
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+RELATION_TRIGGER = """
+CREATE TRIGGER {table}_{op}_search AFTER {op} ON {table}
+REFERENCING {transition} TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_search_relation();
+"""
+
+RENAME_TRIGGER = """
+CREATE TRIGGER {table}_rename_search AFTER UPDATE ON {table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_search_rename(
+    '{through}', '{column}'
+);
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_search ON core_recipe;
+DROP FUNCTION core_recipe_search_row() CASCADE;
+DROP FUNCTION core_recipe_search_relation() CASCADE;
+DROP FUNCTION core_recipe_search_rename() CASCADE;
+DROP FUNCTION core_recipe_document(bigint, text, text);
+"""
+
+BACKFILL = """
+UPDATE core_recipe
+SET search_vector = core_recipe_document(id, title, description);
+"""
+
+
+def trigger_sql():
+    """Return the SQL creating the relation and rename triggers."""
+    sql = ''
+    for table in ['core_recipe_tags', 'core_recipe_ingredients']:
+        for op, transition in [('INSERT', 'NEW'), ('DELETE', 'OLD')]:
+            sql += RELATION_TRIGGER.format(
+                table=table, op=op, transition=transition,
+            )
+    sql += RENAME_TRIGGER.format(
+        table='core_tag', through='core_recipe_tags', column='tag_id',
+    )
+    sql += RENAME_TRIGGER.format(
+        table='core_ingredient',
+        through='core_recipe_ingredients',
+        column='ingredient_id',
+    )
+    return sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search__c01407_gin'),
+        ),
+        migrations.RunSQL(
+            CREATE_TRIGGERS + trigger_sql() + BACKFILL,
+            DROP_TRIGGERS,
+        ),
+    ]
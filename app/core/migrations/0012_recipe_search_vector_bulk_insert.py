@@ -0,0 +1,69 @@
+# Generated by Django 4.0.10 on 2026-10-17 07:20
+
+from django.db import migrations
+
+
+# a bulk insert may supply vectors it computed set-based (see
+# recipe/importer.py) instead of paying for a document query per row; the
+# ORM always inserts NULL, so its inserts are still indexed here. Names are
+# aggregated in a fixed order so both ways build the same vector.
+DOCUMENT = """
+CREATE OR REPLACE FUNCTION core_recipe_document(
+    recipe_id bigint, title text, description text
+) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' '{order})
+            FROM core_tag t
+            JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' '{order})
+            FROM core_ingredient i
+            JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+$$ LANGUAGE sql STABLE;
+"""
+
+TRUST_INSERTED_VECTOR = """
+CREATE OR REPLACE FUNCTION core_recipe_search_row() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.search_vector IS NOT NULL THEN
+        RETURN NEW;
+    END IF;
+    NEW.search_vector := core_recipe_document(
+        NEW.id, NEW.title, NEW.description
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+ALWAYS_COMPUTE_VECTOR = """
+CREATE OR REPLACE FUNCTION core_recipe_search_row() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_document(
+        NEW.id, NEW.title, NEW.description
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipeimport'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            DOCUMENT.replace('{order}', ' ORDER BY name') + TRUST_INSERTED_VECTOR,
+            DOCUMENT.replace('{order}', '') + ALWAYS_COMPUTE_VECTOR,
+        ),
+    ]
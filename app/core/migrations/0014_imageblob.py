@@ -0,0 +1,93 @@
+# Generated by Django 4.0.10 on 2026-10-17 07:27
+
+import core.models
+from django.db import migrations, models
+
+
+# statement level, like the change triggers of migration 0007: the image
+# references a statement added (+1) and removed (-1) are netted per name and
+# applied with one upsert, in name order so concurrent statements lock the
+# blob rows in the same order
+UPSERT = """
+        INSERT INTO core_imageblob (name, refcount, updated_at)
+        SELECT name, sum(n), now() FROM ({delta}) d
+        GROUP BY name HAVING sum(n) <> 0
+        ORDER BY name
+        ON CONFLICT (name) DO UPDATE
+        SET refcount = core_imageblob.refcount + EXCLUDED.refcount,
+            updated_at = EXCLUDED.updated_at;
+"""
+
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_count_image_refs() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN""" + UPSERT.format(delta="""
+            SELECT image AS name, 1 AS n FROM new_rows WHERE image <> ''
+        """) + """
+    ELSIF TG_OP = 'DELETE' THEN""" + UPSERT.format(delta="""
+            SELECT image AS name, -1 AS n FROM old_rows WHERE image <> ''
+        """) + """
+    ELSE""" + UPSERT.format(delta="""
+            SELECT n.image AS name, 1 AS n
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE n.image IS DISTINCT FROM o.image AND n.image <> ''
+            UNION ALL
+            SELECT o.image, -1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE n.image IS DISTINCT FROM o.image AND o.image <> ''
+        """) + """
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_insert_image_refs AFTER INSERT ON core_recipe
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION core_count_image_refs();
+CREATE TRIGGER core_recipe_update_image_refs AFTER UPDATE ON core_recipe
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION core_count_image_refs();
+CREATE TRIGGER core_recipe_delete_image_refs AFTER DELETE ON core_recipe
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION core_count_image_refs();
+"""
+
+DROP_TRIGGERS = """
+DROP FUNCTION core_count_image_refs() CASCADE;
+"""
+
+# images stored before the blobs were counted
+BACKFILL = """
+INSERT INTO core_imageblob (name, refcount, updated_at)
+SELECT image, count(*), now() FROM core_recipe
+WHERE image <> '' GROUP BY image;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.models.recipe_image_storage, upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(condition=models.Q(('refcount', 0)), fields=['updated_at'], name='imageblob_unreferenced_idx'),
+        ),
+        migrations.RunSQL(BACKFILL + CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
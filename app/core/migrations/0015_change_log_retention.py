@@ -0,0 +1,35 @@
+# Generated by Django 4.0.10 on 2026-10-17 08:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# the change triggers of migration 0007 insert without created_at
+SET_DEFAULT = 'ALTER TABLE core_change ALTER COLUMN created_at SET DEFAULT now();'
+DROP_DEFAULT = 'ALTER TABLE core_change ALTER COLUMN created_at DROP DEFAULT;'
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_imageblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txid', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(SET_DEFAULT, DROP_DEFAULT),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['created_at'], name='core_change_created_6ef3cf_idx'),
+        ),
+    ]
@@ -5,19 +5,34 @@ import uuid
 import os
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import get_storage_class
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core.storage import shard_name
+
+
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image."""
     ext = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{ext}'
     # the str is created below in the appropriate format for the operating system that we're running the code on
-    return os.path.join('uploads', 'recipe', filename)
+    # spread over RECIPE_IMAGE_SHARD_LEVELS levels of directories named
+    # after the leading hex digits, so no directory grows to millions
+    return shard_name(os.path.join('uploads', 'recipe'), f'{uuid.uuid4()}', ext)
+
+
+def recipe_image_storage():
+    """Return the storage of recipe images, set by RECIPE_IMAGE_STORAGE."""
+    return get_storage_class(
+        getattr(settings, 'RECIPE_IMAGE_STORAGE', None),
+    )()
 
 class UserManager(BaseUserManager):
     """Manager for users."""
@@ -83,10 +98,39 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)  # optional
     tags = models.ManyToManyField('Tag')   # optional
     ingredients = models.ManyToManyField('Ingredient')   # optional
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)  # optional
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )  # optional
+    # {size: {format: file name}} of the resized copies of image, written by
+    # recipe/images.py once they are generated, {} until then
+    image_variants = models.JSONField(default=dict, editable=False)
     # When Django calls the function specified in upload_to, it automatically provides \
     # the instance and filename arguments.
     # The uploaded image will be saved to the path returned by the recipe_image_file_path function.
+    # title, tag and ingredient names and description, kept current by
+    # database triggers (see migration 0008)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            # one per supported sort (see recipe/pagination.py), so a page
+            # of a user's recipes is an index range scan with no sort step
+            models.Index(
+                fields=['user', 'id'],
+                name='recipe_user_id_idx',
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='recipe_user_time_id_idx',
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='recipe_user_price_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -99,6 +143,24 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        constraints = [
+            # lets concurrent creates of the same name resolve with
+            # INSERT ... ON CONFLICT DO NOTHING instead of duplicating it
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+        indexes = [
+            # typo tolerant and prefix lookups on name within one user
+            GinIndex(
+                fields=['user', 'name'],
+                name='tag_user_name_trgm',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -111,8 +173,115 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        constraints = [
+            # lets concurrent creates of the same name resolve with
+            # INSERT ... ON CONFLICT DO NOTHING instead of duplicating it
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
+        indexes = [
+            # typo tolerant and prefix lookups on name within one user
+            GinIndex(
+                fields=['user', 'name'],
+                name='ingredient_user_name_trgm',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+        ]
+
     def __str__(self):
         return self.name
 # if you have a Recipe object, you can get all its tags by calling recipe.tags.all().
 # Similarly, you can get all recipes that a particular tag is associated with by calling tag.recipe_set.all().
 # recipe_set is the default related name Django creates for the reverse lookup from Tag to Recipe.
+
+
+class Change(models.Model):
+    """Row change of a recipe, tag or ingredient, used for delta sync.
+
+    Rows are written by database triggers (see migration 0007), so bulk
+    inserts and raw SQL are recorded too. txid is the id of the writing
+    transaction; changes are only handed out once every transaction before
+    them has finished, so out of order commits can't be skipped. Old rows
+    are pruned, see ChangeLogHorizon.
+    """
+    user_id = models.BigIntegerField()   # no FK, tombstones outlive rows
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=6)   # INSERT, UPDATE or DELETE
+    txid = models.BigIntegerField()
+    # the triggers leave it to the column default (see migration 0015)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'txid', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+class ChangeLogHorizon(models.Model):
+    """Transaction id below which the change log has been pruned.
+
+    A single row, moved forward by recipe.sync.prune_changes. A sync cursor
+    below it may have missed pruned changes and needs a full resync.
+    """
+    txid = models.BigIntegerField(default=0)
+
+
+class ImageBlob(models.Model):
+    """Stored recipe image and the number of recipes referencing it.
+
+    Rows are kept by database triggers on core_recipe (see migration 0014),
+    so bulk updates, raw SQL and cascading deletes are counted too. A blob
+    with no references is left for the orphan collector; updated_at tells
+    since when it has been unreferenced.
+    """
+    name = models.CharField(max_length=255, unique=True)   # as in Recipe.image
+    refcount = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['updated_at'],
+                name='imageblob_unreferenced_idx',
+                condition=models.Q(refcount=0),
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeImport(models.Model):
+    """Progress of a bulk recipe import, kept to resume it.
+
+    position counts the input records already committed, imported or
+    rejected; it is advanced in the same transaction as the batch it
+    covers, so a resumed import never loads a record twice.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    key = models.CharField(max_length=255)   # chosen by the client
+    position = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'],
+                name='unique_recipe_import_key_per_user',
+            ),
+        ]
+
+    def __str__(self):
+        return self.key
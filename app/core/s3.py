@@ -0,0 +1,225 @@
+"""
+Storage of recipe images in an S3 compatible object store.
+
+Set RECIPE_IMAGE_STORAGE = 'core.s3.S3Storage' and configure S3_STORAGE to
+keep images in a bucket (AWS S3, MinIO, Ceph, R2, ...) instead of the local
+media volume, so app replicas don't need shared disk.
+
+Uploads are streamed: content is read a PART_SIZE part at a time and sent
+as a multipart upload, so at most one part is held in memory whatever the
+file size; files smaller than one part are sent with a single PUT.
+
+Like ContentAddressedStorage, files are stored once per distinct content
+under blob_name(directory, sha256). The digest is only known once the
+upload has streamed through, so it goes to a temporary key first and is
+then copied server side, or dropped if the blob already exists.
+
+url() returns presigned GET URLs so clients download straight from the
+store. Time is cut into epochs of half the URL lifetime and a name gets one
+URL per epoch, valid until at least the end of the next one. The response
+cache and ETags of recipe/cache.py include url_epoch(), so a cached or
+revalidated response never hands out URLs older than that.
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+from core.storage import blob_name
+
+
+DEFAULTS = {
+    'BUCKET': '',
+    'ENDPOINT_URL': None,   # e.g. http://minio:9000, None for AWS
+    'REGION': None,
+    'ACCESS_KEY': None,   # None uses boto3's credential chain
+    'SECRET_KEY': None,
+    'DIRECTORY': 'uploads/recipe',   # prefix of the blob keys
+    'PART_SIZE': 8 * 1024 * 1024,   # S3 requires at least 5 MB
+    'URL_EXPIRES': 60 * 60,   # seconds presigned URLs are valid
+    'CACHE_ALIAS': 'default',
+}
+SPOOL_SIZE = 1024 * 1024   # downloads kept in memory up to this size
+
+
+def get_setting(name):
+    """Return an S3_STORAGE setting, falling back to the default."""
+    return getattr(settings, 'S3_STORAGE', {}).get(name, DEFAULTS[name])
+
+
+def iter_parts(content, part_size):
+    """Yield the data of content in parts of part_size, the last shorter."""
+    buffer = bytearray()
+    for chunk in content.chunks():
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+@deconstructible
+class S3Storage(Storage):
+    """Content addressed storage in an S3 compatible bucket."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def setting(self, name):
+        return self.options.get(name, get_setting(name))
+
+    @property
+    def client(self):
+        """Return the S3 client, created on first use."""
+        if not hasattr(self, '_client'):
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.setting('ENDPOINT_URL'),
+                region_name=self.setting('REGION'),
+                aws_access_key_id=self.setting('ACCESS_KEY'),
+                aws_secret_access_key=self.setting('SECRET_KEY'),
+            )
+        return self._client
+
+    @property
+    def bucket(self):
+        return self.setting('BUCKET')
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as exc:
+            if exc.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def _upload(self, key, content, content_type):
+        """Stream content to key, multipart when it is over one part.
+
+        Only the part being sent is held in memory. Returns the hex SHA-256
+        digest of the data sent.
+        """
+        digest = hashlib.sha256()
+        extra = {'ContentType': content_type}
+        part_size = self.setting('PART_SIZE')
+        size = getattr(content, 'size', None)
+        if size is not None and size <= part_size:   # one PUT is enough
+            data = b''.join(content.chunks())
+            digest.update(data)
+            self.client.put_object(
+                Bucket=self.bucket, Key=key, Body=data, **extra,
+            )
+            return digest.hexdigest()
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, **extra,
+        )['UploadId']
+        try:
+            uploaded = []
+            parts = iter_parts(content, part_size)
+            for number, data in enumerate(parts, 1):
+                digest.update(data)
+                part = self.client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id,
+                    PartNumber=number, Body=data,
+                )
+                uploaded.append({'PartNumber': number, 'ETag': part['ETag']})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': uploaded},
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+            )
+            raise
+        return digest.hexdigest()
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        directory = self.setting('DIRECTORY')
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+        temp_key = f'{directory}/.uploads/{uuid.uuid4().hex}{ext}'
+
+        digest = self._upload(temp_key, content, content_type)
+        key = blob_name(directory, digest, ext)
+        try:
+            if self._head(key) is None:
+                self.client.copy_object(
+                    Bucket=self.bucket, Key=key,
+                    CopySource={'Bucket': self.bucket, 'Key': temp_key},
+                )
+        finally:
+            self.client.delete_object(Bucket=self.bucket, Key=temp_key)
+        return key
+
+    def _open(self, name, mode='rb'):
+        """Download name into a spooled file, seekable for Pillow."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            self.client.download_fileobj(self.bucket, name, spool)
+        except ClientError as exc:
+            spool.close()
+            if exc.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(name)
+            raise
+        spool.seek(0)
+        return File(spool, name=name)
+
+    def get_available_name(self, name, max_length=None):
+        """Return name, the stored name is derived from the content."""
+        return name
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def get_modified_time(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['LastModified']
+
+    def url_period(self):
+        """Return the seconds a presigned URL is handed out for."""
+        return max(self.setting('URL_EXPIRES') // 2, 1)
+
+    def url_epoch(self):
+        """Return the number of the current URL period."""
+        return int(time.time()) // self.url_period()
+
+    def url(self, name):
+        """Return the presigned download URL of name for this epoch."""
+        cache = caches[self.setting('CACHE_ALIAS')]
+        cache_key = f's3-url:{self.bucket}:{self.url_epoch()}:{name}'
+        url = cache.get(cache_key)
+        if url is None:
+            url = self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': name},
+                ExpiresIn=self.setting('URL_EXPIRES'),
+            )
+            # signed during the epoch, so valid for at least one more
+            cache.set(cache_key, url, self.url_period())
+        return url
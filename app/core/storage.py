@@ -0,0 +1,106 @@
+"""
+Storage backends for uploaded files.
+"""
+import functools
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+
+def shard_levels():
+    """Return the directory levels new recipe images are spread over."""
+    return getattr(settings, 'RECIPE_IMAGE_SHARD_LEVELS', 2)
+
+
+def shard_name(directory, key, ext='', levels=None):
+    """Return the name of file key + ext, sharded by the prefix of key.
+
+    Each level is a directory named after the next two characters of key,
+    so with two levels of hex keys no directory holds more than 256
+    entries until the last one, which holds 1/65536 of the files.
+    """
+    if levels is None:
+        levels = shard_levels()
+    shards = [key[2 * level:2 * level + 2] for level in range(levels)]
+    return os.path.join(directory, *shards, key + ext)
+
+
+def in_directory(directory, operation, attempts=3):
+    """Return operation() run after making sure directory exists.
+
+    shard_recipe_images removes the directories it empties, so one may
+    vanish between being made and a file being created in it; it is then
+    made again and operation retried.
+    """
+    for attempt in range(attempts):
+        os.makedirs(directory, exist_ok=True)
+        try:
+            return operation()
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+
+
+def blob_name(directory, digest, ext=''):
+    """Return the name of the blob with hex digest, sharded by prefix."""
+    return shard_name(directory, digest, ext)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage keeping a single copy of each distinct file.
+
+    Files are hashed with SHA-256 while they are streamed to a temporary
+    file and then renamed to blob_name(directory, digest), so the name
+    asked for only contributes its extension. Saving content that is
+    already stored writes nothing and returns the existing name, and as a
+    name always holds the same bytes, its URL can be cached forever.
+
+    Blobs are shared, so they aren't deleted when one reference goes away;
+    the references to each are counted in ImageBlob (see migration 0014).
+    """
+
+    def __init__(self, directory='uploads/recipe', **kwargs):
+        self.directory = directory
+        super().__init__(**kwargs)
+
+    def get_available_name(self, name, max_length=None):
+        """Return name, the stored name is derived from the content."""
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        directory = self.path(self.directory)
+
+        digest = hashlib.sha256()
+        fd, temp_path = in_directory(directory, functools.partial(
+            tempfile.mkstemp, dir=directory, prefix='.upload-',
+        ))
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            name = blob_name(self.directory, digest.hexdigest(), ext)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.unlink(temp_path)   # a duplicate costs no disk
+                # a fresh mtime keeps the blob clear of the orphan grace
+                # period until the new reference is committed
+                os.utime(path)
+                return name
+
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # atomic, never seen half written
+            in_directory(os.path.dirname(path),
+                         functools.partial(os.replace, temp_path, path))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        return name
@@ -0,0 +1,137 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from core import authentication
+from core.authentication import (
+    CachedTokenAuthentication,
+    LocalLRUCache,
+)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test resolving tokens through the local and shared caches."""
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_cached_token_skips_database(self):
+        """Test a token resolved once is served without queries."""
+        user, token = self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.auth.authenticate_credentials(
+                self.token.key,
+            )
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(cached_user, self.user)
+        self.assertEqual(cached_token.key, self.token.key)
+
+    def test_shared_tier_used_after_local_miss(self):
+        """Test another process (empty local tier) reuses the shared tier."""
+        self.auth.authenticate_credentials(self.token.key)
+        authentication.local_cache.clear()
+
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+
+    def test_deleted_token_rejected(self):
+        """Test logging out (deleting the token) invalidates the cache."""
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_inactive_user_rejected(self):
+        """Test deactivating a user invalidates their cached tokens."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_user_change_invalidates_other_processes(self):
+        """Test a version bump makes local entries of every process stale."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        # as if another worker saved the user, only the shared tier changes
+        authentication.invalidate_user_tokens(self.user.id)
+
+        with self.assertNumQueries(2):   # token owner + token/user join
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_recached_before_commit_rejected(self):
+        """Test an entry cached while the logout commits is retired."""
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+        entry = cache.get(authentication._token_key(key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            # a request that still sees the token caches it again under
+            # the version the delete just set
+            version = authentication.get_user_version(self.user.id)
+            cache.set(authentication._token_key(key), (entry[0], version))
+
+        authentication.local_cache.clear()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_cached_entry_without_password(self):
+        """Test the password hash is neither cached nor lost on save."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        fields, _ = cache.get(authentication._token_key(self.token.key))
+        self.assertNotIn('password', fields)
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        user.name = 'New name'
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'New name')
+        self.assertTrue(self.user.check_password('testpass123'))
+
+
+class LocalLRUCacheTests(TestCase):
+    """Test the bounded in-process LRU."""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows past max_size."""
+        lru = LocalLRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')   # b is now the least recently used
+        lru.set('c', 3)
+
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_expired_entries_dropped(self):
+        """Test entries are not served past their TTL."""
+        lru = LocalLRUCache(max_size=2, ttl=-1)
+        lru.set('a', 1)
+
+        self.assertIsNone(lru.get('a'))
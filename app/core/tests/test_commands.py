@@ -1,13 +1,25 @@
 """
 Test custom Django management commands.
 """
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Change, ChangeLogHorizon, Recipe
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -31,3 +43,203 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ExportRecipesCommandTests(TestCase):
+    """Test the export_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        for title in ['Curry', 'Toast']:
+            Recipe.objects.create(
+                user=self.user,
+                title=title,
+                time_minutes=10,
+                price=Decimal('2.50'),
+            )
+
+    def test_export_to_stdout(self):
+        """Test exporting NDJSON to stdout."""
+        out = StringIO()
+
+        call_command('export_recipes', 'user@example.com', stdout=out)
+
+        titles = [
+            json.loads(line)['title']
+            for line in out.getvalue().splitlines()
+        ]
+        self.assertEqual(titles, ['Curry', 'Toast'])
+
+    def test_export_gzipped_file(self):
+        """Test exporting gzipped CSV to a file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'recipes.csv.gz')
+            call_command(
+                'export_recipes', 'user@example.com',
+                '--type', 'csv', '--gzip', '--output', path,
+                stderr=StringIO(),
+            )
+            with gzip.open(path, 'rt') as export:
+                lines = export.read().splitlines()
+
+        self.assertTrue(lines[0].startswith('id,title,'))
+        self.assertEqual(len(lines), 3)
+
+    def test_export_unknown_user_error(self):
+        """Test exporting for an unknown email fails."""
+        with self.assertRaises(CommandError):
+            call_command('export_recipes', 'nobody@example.com')
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def test_import_file(self):
+        """Test importing a file reports progress and loads the recipes."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'recipes.ndjson')
+            with open(path, 'w') as import_file:
+                for title in ['Curry', 'Toast', 'Soup']:
+                    import_file.write(json.dumps({
+                        'title': title,
+                        'time_minutes': 10,
+                        'price': '2.50',
+                        'tags': ['Quick'],
+                    }) + '\n')
+            out = StringIO()
+
+            call_command(
+                'import_recipes', 'user@example.com', path,
+                '--batch-size', '2', stdout=out,
+            )
+
+        self.assertIn('2 records read', out.getvalue())
+        self.assertIn('3 imported', out.getvalue())
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+    def test_import_missing_file_error(self):
+        """Test importing a missing file fails."""
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', 'user@example.com', '/no/such/file')
+
+
+class GenerateImageVariantsCommandTests(TestCase):
+    """Test the generate_image_variants command."""
+
+    def test_fills_missing_variants(self):
+        """Test only recipes with an image but no variants are processed."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        pending = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=10, price=Decimal('5.00'),
+            image='uploads/recipe/a.jpg',
+        )
+        Recipe.objects.create(
+            user=user, title='Toast', time_minutes=5, price=Decimal('1.00'),
+            image='uploads/recipe/b.jpg', image_variants={'128': {}},
+        )
+        Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        out = StringIO()
+
+        with patch(
+            'core.management.commands.generate_image_variants.'
+            'generate_variants'
+        ) as generate:
+            call_command('generate_image_variants', stdout=out)
+
+        generate.assert_called_once_with(pending.id)
+        self.assertIn('Generated variants for 1 images', out.getvalue())
+
+
+class CollectOrphanedMediaCommandTests(TestCase):
+    """Test the collect_orphaned_media command."""
+
+    def test_dry_run_then_collect(self):
+        """Test a dry run lists orphans and a real run deletes them."""
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            path = os.path.join(media_root, 'uploads', 'recipe', 'old.jpg')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as media_file:
+                media_file.write(b'data')
+            os.utime(path, (0, 0))
+            out = StringIO()
+
+            call_command('collect_orphaned_media', '--dry-run', stdout=out)
+            self.assertTrue(os.path.exists(path))
+            call_command('collect_orphaned_media', '--rate', '100',
+                         stdout=out)
+
+            self.assertFalse(os.path.exists(path))
+        self.assertIn('uploads/recipe/old.jpg (4 bytes)', out.getvalue())
+        self.assertIn('Would delete 1 orphaned files', out.getvalue())
+        self.assertIn('Deleted 1 orphaned files, 4 bytes.', out.getvalue())
+
+
+class PruneChangeLogCommandTests(TestCase):
+    """Test the prune_change_log command."""
+
+    def test_prune(self):
+        """Test old changes are deleted and the horizon recorded."""
+        old = timezone.now() - timedelta(days=40)
+        for txid, created_at in ((1, old), (2, old), (5, timezone.now())):
+            Change.objects.create(
+                user_id=1, model='recipe', object_id=txid, action='INSERT',
+                txid=txid, created_at=created_at,
+            )
+        out = StringIO()
+
+        call_command('prune_change_log', '--days', '30', stdout=out)
+
+        self.assertEqual(
+            list(Change.objects.values_list('txid', flat=True)), [5],
+        )
+        self.assertEqual(ChangeLogHorizon.objects.get().txid, 3)
+        self.assertIn('Deleted 2 changes', out.getvalue())
+
+    def test_negative_days_error(self):
+        """Test a negative retention is rejected."""
+        with self.assertRaises(CommandError):
+            call_command('prune_change_log', '--days', '-1')
+
+
+class ShardRecipeImagesCommandTests(TestCase):
+    """Test the shard_recipe_images command."""
+
+    def test_shard(self):
+        """Test a dry run counts and a real run moves images."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=10, price=Decimal('5.00'),
+            image='uploads/recipe/abcd.jpg',
+        )
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'uploads', 'recipe'))
+            with open(recipe.image.path, 'wb') as image_file:
+                image_file.write(b'data')
+            out = StringIO()
+
+            call_command('shard_recipe_images', '--dry-run', stdout=out)
+            call_command('shard_recipe_images', '--levels', '1', stdout=out)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'uploads/recipe/ab/abcd.jpg')
+        self.assertIn('1 images to move.', out.getvalue())
+        self.assertIn('Moved 1 images, 0 skipped.', out.getvalue())
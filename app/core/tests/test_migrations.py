@@ -0,0 +1,69 @@
+"""
+Tests for data migrations.
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicateNamesMigrationTests(TransactionTestCase):
+    """Test migration 0006 on a database with duplicate names."""
+    migrate_from = [('core', '0005_recipe_image')]
+    migrate_to = [('core', '0006_unique_tag_ingredient_name_per_user')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate(self.migrate_from)
+        self.old_apps = executor.loader.project_state(
+            self.migrate_from,
+        ).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.latest)
+
+    def test_duplicates_merged_before_constraints(self):
+        """Test duplicates are merged and the constraints then added."""
+        User = self.old_apps.get_model('core', 'User')
+        Recipe = self.old_apps.get_model('core', 'Recipe')
+        Tag = self.old_apps.get_model('core', 'Tag')
+        Ingredient = self.old_apps.get_model('core', 'Ingredient')
+        user = User.objects.create(email='user@example.com')
+        first = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=10, price='5.00',
+        )
+        second = Recipe.objects.create(
+            user=user, title='Dal', time_minutes=10, price='5.00',
+        )
+        kept_tag = Tag.objects.create(user=user, name='Dinner')
+        first.tags.add(kept_tag)
+        second.tags.add(Tag.objects.create(user=user, name='Dinner'))
+        kept_ingredient = Ingredient.objects.create(user=user, name='Rice')
+        first.ingredients.add(kept_ingredient)
+        both = Ingredient.objects.create(user=user, name='Rice')
+        first.ingredients.add(both)
+        second.ingredients.add(both)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+
+        apps = executor.loader.project_state(self.migrate_to).apps
+        Recipe = apps.get_model('core', 'Recipe')
+        Tag = apps.get_model('core', 'Tag')
+        Ingredient = apps.get_model('core', 'Ingredient')
+        self.assertEqual(list(Tag.objects.values_list('id', flat=True)),
+                         [kept_tag.id])
+        self.assertEqual(
+            list(Ingredient.objects.values_list('id', flat=True)),
+            [kept_ingredient.id],
+        )
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                list(recipe.tags.values_list('id', flat=True)),
+                [kept_tag.id],
+            )
+            self.assertEqual(
+                list(recipe.ingredients.values_list('id', flat=True)),
+                [kept_ingredient.id],
+            )
@@ -1,8 +1,9 @@
 """
 Tests for models.
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 
 from decimal import Decimal
 from core import models
@@ -82,6 +83,16 @@ class ModelTests(TestCase):
         self.assertEqual(str(tag), tag.name)
 
 
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot have two tags with the same name."""
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        models.Tag.objects.create(user=user, name='Tag1')
+        models.Tag.objects.create(user=other_user, name='Tag1')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Tag1')
+
     def test_create_ingredient(self):
         """Test creating an ingredient is successful."""
         user = create_user()
@@ -93,6 +104,7 @@ class ModelTests(TestCase):
         self.assertEqual(str(ingredient), ingredient.name)
 
 
+    @override_settings(RECIPE_IMAGE_SHARD_LEVELS=0)
     @patch('core.models.uuid.uuid4')
     # mock_uuid.return_value = uuids means that whenever the code being tested calls uuid.uuid4(),
     # it will get the value uuids instead of a real UUID.
@@ -104,3 +116,39 @@ class ModelTests(TestCase):
 
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
 
+    @patch('core.models.uuid.uuid4')
+    def test_recipe_file_name_sharded(self, mock_uuid):
+        """Test image paths are spread by the leading uuid digits."""
+        mock_uuid.return_value = 'abcdef12-3456'
+
+        file_path = models.recipe_image_file_path(None, 'example.jpg')
+
+        self.assertEqual(file_path, 'uploads/recipe/ab/cd/abcdef12-3456.jpg')
+
+
+    def test_image_blob_refcount(self):
+        """Test image references are counted by the database."""
+        user = create_user()
+        recipes = [
+            models.Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'), image='uploads/recipe/a.jpg',
+            )
+            for i in range(3)
+        ]
+
+        def refcount(name):
+            return models.ImageBlob.objects.get(name=name).refcount
+
+        self.assertEqual(refcount('uploads/recipe/a.jpg'), 3)
+
+        models.Recipe.objects.filter(id=recipes[0].id).update(
+            image='uploads/recipe/b.jpg',
+        )
+        models.Recipe.objects.filter(id=recipes[1].id).update(title='New')
+        self.assertEqual(refcount('uploads/recipe/a.jpg'), 2)
+        self.assertEqual(refcount('uploads/recipe/b.jpg'), 1)
+
+        user.delete()   # cascades to the recipes
+        self.assertEqual(refcount('uploads/recipe/a.jpg'), 0)
+        self.assertEqual(refcount('uploads/recipe/b.jpg'), 0)
@@ -0,0 +1,238 @@
+"""
+Tests for the S3 storage backend.
+
+The unit tests stub the S3 API with botocore's Stubber. The round trip
+test needs a real bucket, e.g. MinIO's (see docker-compose.yml), and runs
+when S3_TEST_ENDPOINT_URL is set.
+"""
+import hashlib
+import importlib.util
+import os
+import unittest
+import uuid
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.storage import blob_name
+
+HAS_BOTO3 = importlib.util.find_spec('boto3') is not None
+if HAS_BOTO3:
+    import boto3
+    from botocore.stub import ANY, Stubber
+
+    from core.s3 import S3Storage, iter_parts
+
+DIRECTORY = 'uploads/recipe'
+
+
+def digest_name(data, ext='.jpg'):
+    return blob_name(DIRECTORY, hashlib.sha256(data).hexdigest(), ext)
+
+
+@unittest.skipUnless(HAS_BOTO3, 'boto3 is not installed')
+class IterPartsTests(SimpleTestCase):
+    """Test splitting content into upload parts."""
+
+    def test_parts(self):
+        """Test chunks are regrouped into parts of the part size."""
+        content = ContentFile(b'abcdefghijk')
+        content.DEFAULT_CHUNK_SIZE = 3
+
+        self.assertEqual(list(iter_parts(content, 4)),
+                         [b'abcd', b'efgh', b'ijk'])
+
+    def test_empty(self):
+        """Test empty content yields no part."""
+        self.assertEqual(list(iter_parts(ContentFile(b''), 4)), [])
+
+
+@unittest.skipUnless(HAS_BOTO3, 'boto3 is not installed')
+class S3StorageTests(SimpleTestCase):
+    """Test the S3 storage against a stubbed client."""
+
+    def setUp(self):
+        self.storage = S3Storage(BUCKET='media', PART_SIZE=5)
+        self.storage._client = boto3.client(
+            's3',
+            region_name='us-east-1',
+            aws_access_key_id='key',
+            aws_secret_access_key='secret',
+        )
+        self.stubber = Stubber(self.storage.client)
+        self.stubber.activate()
+        cache.clear()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def expect_dedup(self, name, exists):
+        """Expect the blob check, the copy if needed and the cleanup."""
+        if exists:
+            self.stubber.add_response(
+                'head_object', {'ContentLength': 1},
+                {'Bucket': 'media', 'Key': name},
+            )
+        else:
+            self.stubber.add_client_error(
+                'head_object', service_error_code='404',
+                http_status_code=404,
+                expected_params={'Bucket': 'media', 'Key': name},
+            )
+            self.stubber.add_response(
+                'copy_object', {},
+                {'Bucket': 'media', 'Key': name, 'CopySource': ANY},
+            )
+        self.stubber.add_response(
+            'delete_object', {}, {'Bucket': 'media', 'Key': ANY},
+        )
+
+    def test_small_file_single_put(self):
+        """Test a file within one part is sent with one PUT and copied."""
+        self.stubber.add_response('put_object', {}, {
+            'Bucket': 'media', 'Key': ANY, 'Body': b'abc',
+            'ContentType': 'image/jpeg',
+        })
+        self.expect_dedup(digest_name(b'abc'), exists=False)
+
+        name = self.storage.save('photo.JPG', ContentFile(b'abc'))
+
+        self.assertEqual(name, digest_name(b'abc'))
+        self.stubber.assert_no_pending_responses()
+
+    def test_duplicate_not_copied(self):
+        """Test content that is stored already only drops the upload."""
+        self.stubber.add_response('put_object', {}, {
+            'Bucket': 'media', 'Key': ANY, 'Body': b'abc',
+            'ContentType': 'image/jpeg',
+        })
+        self.expect_dedup(digest_name(b'abc'), exists=True)
+
+        name = self.storage.save('photo.jpg', ContentFile(b'abc'))
+
+        self.assertEqual(name, digest_name(b'abc'))
+        self.stubber.assert_no_pending_responses()
+
+    def test_large_file_multipart(self):
+        """Test a file over one part is streamed as a multipart upload."""
+        data = b'abcdefghijkl'
+        self.stubber.add_response(
+            'create_multipart_upload', {'UploadId': 'upload'},
+            {'Bucket': 'media', 'Key': ANY, 'ContentType': 'image/jpeg'},
+        )
+        for number, part in enumerate((b'abcde', b'fghij', b'kl'), 1):
+            self.stubber.add_response('upload_part', {'ETag': f'"{number}"'}, {
+                'Bucket': 'media', 'Key': ANY, 'UploadId': 'upload',
+                'PartNumber': number, 'Body': part,
+            })
+        self.stubber.add_response('complete_multipart_upload', {}, {
+            'Bucket': 'media', 'Key': ANY, 'UploadId': 'upload',
+            'MultipartUpload': {'Parts': [
+                {'PartNumber': 1, 'ETag': '"1"'},
+                {'PartNumber': 2, 'ETag': '"2"'},
+                {'PartNumber': 3, 'ETag': '"3"'},
+            ]},
+        })
+        self.expect_dedup(digest_name(data), exists=False)
+
+        name = self.storage.save('photo.jpg', ContentFile(data))
+
+        self.assertEqual(name, digest_name(data))
+        self.stubber.assert_no_pending_responses()
+
+    def test_failed_multipart_aborted(self):
+        """Test a failing part aborts the upload, so no parts are kept."""
+        self.stubber.add_response(
+            'create_multipart_upload', {'UploadId': 'upload'},
+        )
+        self.stubber.add_client_error('upload_part', http_status_code=500)
+        self.stubber.add_response('abort_multipart_upload', {}, {
+            'Bucket': 'media', 'Key': ANY, 'UploadId': 'upload',
+        })
+
+        with self.assertRaises(Exception):
+            self.storage.save('photo.jpg', ContentFile(b'abcdefghijkl'))
+        self.stubber.assert_no_pending_responses()
+
+    def test_missing_file(self):
+        """Test opening a missing key raises FileNotFoundError."""
+        self.stubber.add_client_error(
+            'head_object', service_error_code='404', http_status_code=404,
+        )
+
+        self.assertFalse(self.storage.exists('uploads/recipe/missing.jpg'))
+        self.stubber.add_client_error(
+            'head_object', service_error_code='404', http_status_code=404,
+        )
+        with self.assertRaises(FileNotFoundError):
+            self.storage.size('uploads/recipe/missing.jpg')
+
+    def test_url_presigned_and_reused(self):
+        """Test the presigned URL is signed once and then reused."""
+        client = self.storage.client
+        with patch.object(client, 'generate_presigned_url',
+                          return_value='https://signed') as sign:
+            first = self.storage.url('uploads/recipe/a.jpg')
+            second = self.storage.url('uploads/recipe/a.jpg')
+
+        self.assertEqual(first, 'https://signed')
+        self.assertEqual(second, first)
+        sign.assert_called_once_with(
+            'get_object',
+            Params={'Bucket': 'media', 'Key': 'uploads/recipe/a.jpg'},
+            ExpiresIn=60 * 60,
+        )
+
+    def test_url_signed_again_next_epoch(self):
+        """Test each URL epoch gets a URL of its own."""
+        client = self.storage.client
+        with patch.object(client, 'generate_presigned_url',
+                          side_effect=['https://first', 'https://second']), \
+                patch('core.s3.time.time', return_value=1800 * 10):
+            first = self.storage.url('uploads/recipe/a.jpg')
+            epoch = self.storage.url_epoch()
+            with patch('core.s3.time.time', return_value=1800 * 11):
+                second = self.storage.url('uploads/recipe/a.jpg')
+                self.assertEqual(self.storage.url_epoch(), epoch + 1)
+
+        self.assertEqual((first, second), ('https://first', 'https://second'))
+
+
+@unittest.skipUnless(
+    HAS_BOTO3 and os.environ.get('S3_TEST_ENDPOINT_URL'),
+    'set S3_TEST_ENDPOINT_URL to run against a real bucket',
+)
+class S3StorageRoundTripTests(SimpleTestCase):
+    """Test the S3 storage against a real bucket."""
+
+    def setUp(self):
+        self.storage = S3Storage(
+            ENDPOINT_URL=os.environ['S3_TEST_ENDPOINT_URL'],
+            BUCKET=os.environ.get('S3_TEST_BUCKET', 'test'),
+            ACCESS_KEY=os.environ.get('S3_TEST_ACCESS_KEY'),
+            SECRET_KEY=os.environ.get('S3_TEST_SECRET_KEY'),
+            REGION='us-east-1',
+            PART_SIZE=5 * 1024 * 1024,
+            DIRECTORY=f'test-{uuid.uuid4().hex}',
+        )
+        try:
+            self.storage.client.create_bucket(Bucket=self.storage.bucket)
+        except self.storage.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    def test_round_trip(self):
+        """Test a multipart file is stored once and read back whole."""
+        data = os.urandom(11 * 1024 * 1024)
+
+        name = self.storage.save('photo.jpg', ContentFile(data))
+        again = self.storage.save('other.jpg', ContentFile(data))
+
+        self.assertEqual(again, name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), len(data))
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), data)
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
@@ -0,0 +1,79 @@
+"""
+Tests for storage backends.
+"""
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.storage import ContentAddressedStorage, blob_name
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    """Test the content addressed storage."""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def stored_files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.location) for name in names
+        ]
+
+    def test_named_by_content(self):
+        """Test files are stored under the sharded hash of their content."""
+        name = self.storage.save('uploads/recipe/a.JPG', ContentFile(b'abc'))
+
+        digest = ('ba7816bf8f01cfea414140de5dae2223'
+                  'b00361a396177a9cb410ff61f20015ad')   # sha256 of abc
+        self.assertEqual(name, blob_name('uploads/recipe', digest, '.jpg'))
+        self.assertEqual(name, f'uploads/recipe/ba/78/{digest}.jpg')
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'abc')
+
+    def test_duplicates_stored_once(self):
+        """Test saving the same content again reuses the stored blob."""
+        first = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'abc'))
+        second = self.storage.save('uploads/recipe/b.jpg', ContentFile(b'abc'))
+        other = self.storage.save('uploads/recipe/c.jpg', ContentFile(b'xyz'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(self.stored_files()), 2)   # no temporary left
+
+    def test_directory_removed_while_saving(self):
+        """Test a shard directory removed under a save is made again."""
+        replace = os.replace
+        raced = []
+
+        def racing_replace(src, dst):
+            if not raced:   # as if sharding emptied the directory meanwhile
+                raced.append(dst)
+                os.rmdir(os.path.dirname(dst))
+            replace(src, dst)
+
+        with patch('core.storage.os.replace', side_effect=racing_replace) \
+                as mock_replace:
+            name = self.storage.save('uploads/recipe/a.jpg',
+                                     ContentFile(b'abc'))
+
+        self.assertEqual(mock_replace.call_count, 2)
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'abc')
+
+    def test_duplicate_refreshes_mtime(self):
+        """Test a reused blob is marked as recently written."""
+        name = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'abc'))
+        os.utime(self.storage.path(name), (0, 0))
+
+        self.storage.save('uploads/recipe/b.jpg', ContentFile(b'abc'))
+
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
@@ -0,0 +1,140 @@
+"""
+Batch create, update and delete of recipes.
+
+A batch replays many recipe edits in one request: one authentication, one
+lookup of every recipe it touches, one transaction and one DELETE for all
+of its deletions. Creates and updates go through RecipeDetailSerializer, so
+they are validated exactly like the single recipe endpoints.
+
+In atomic mode nothing is written unless every operation is valid, and an
+error while writing rolls back the whole batch. In best_effort mode each
+create or update runs in its own savepoint, and the valid operations are
+applied even when others fail.
+"""
+from django.db import DatabaseError, transaction
+from django.utils.translation import gettext as _
+
+from rest_framework import status
+
+from core.models import Recipe
+
+from recipe import serializers
+
+
+NOT_APPLIED = status.HTTP_424_FAILED_DEPENDENCY   # valid, batch rolled back
+SAVED_STATUS = {
+    'create': status.HTTP_201_CREATED,
+    'update': status.HTTP_200_OK,
+}
+
+
+def _error(code, detail):
+    return {'status': code, 'errors': {'detail': detail}}
+
+
+def _prepare(user, operations, context):
+    """Validate operations, return (results, pending).
+
+    results has an error for every invalid operation and None for the
+    others; pending holds (index, op, recipe or serializer) to apply.
+    """
+    ids = [operation['id'] for operation in operations if 'id' in operation]
+    recipes = Recipe.objects.filter(
+        user=user,
+        id__in=ids,
+    ).prefetch_related('tags', 'ingredients')
+    targets = {recipe.id: recipe for recipe in recipes}
+
+    results = [None] * len(operations)
+    pending = []
+    seen = set()
+    for index, operation in enumerate(operations):
+        op = operation['op']
+        recipe = None
+        if op != 'create':
+            recipe = targets.get(operation['id'])
+            if recipe is None:
+                results[index] = _error(
+                    status.HTTP_404_NOT_FOUND, _('Not found.'),
+                )
+                continue
+            if recipe.id in seen:
+                results[index] = _error(
+                    status.HTTP_400_BAD_REQUEST,
+                    _('Each recipe can only appear once per batch.'),
+                )
+                continue
+            seen.add(recipe.id)
+
+        if op == 'delete':
+            pending.append((index, op, recipe))
+            continue
+
+        serializer = serializers.RecipeDetailSerializer(
+            recipe,
+            data=operation['data'],
+            partial=op == 'update',
+            context=context,
+        )
+        if serializer.is_valid():
+            pending.append((index, op, serializer))
+        else:
+            results[index] = {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': serializer.errors,
+            }
+
+    return results, pending
+
+
+def _save(user, op, serializer):
+    if op == 'create':
+        serializer.save(user=user)
+        return
+
+    serializer.save()
+    # the prefetched tags and ingredients are stale after the update
+    serializer.instance._prefetched_objects_cache = {}
+
+
+def run_batch(user, operations, atomic=True, context=None):
+    """Apply operations for user, return (applied, per operation results)."""
+    results, pending = _prepare(user, operations, context or {})
+    if atomic and any(result is not None for result in results):
+        for index, _op, _target in pending:
+            results[index] = _error(
+                NOT_APPLIED, _('Not applied, another operation failed.'),
+            )
+        return False, results
+
+    with transaction.atomic():
+        deleted = [(index, recipe) for index, op, recipe in pending
+                   if op == 'delete']
+        if deleted:
+            Recipe.objects.filter(
+                id__in=[recipe.id for _index, recipe in deleted],
+            ).delete()
+            for index, _recipe in deleted:
+                results[index] = {'status': status.HTTP_204_NO_CONTENT}
+
+        for index, op, serializer in pending:
+            if op == 'delete':
+                continue
+            if atomic:
+                _save(user, op, serializer)
+            else:
+                try:
+                    with transaction.atomic():   # savepoint per operation
+                        _save(user, op, serializer)
+                except DatabaseError:
+                    results[index] = _error(
+                        status.HTTP_409_CONFLICT,
+                        _('The recipe could not be saved.'),
+                    )
+                    continue
+            results[index] = {
+                'status': SAVED_STATUS[op],
+                'data': serializer.data,
+            }
+
+    return True, results
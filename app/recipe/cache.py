@@ -0,0 +1,241 @@
+"""
+Per-user response cache for the recipe list endpoints.
+
+Cached responses are keyed by user, endpoint and normalized query params,
+plus the user's generation: a counter in the shared cache that is bumped on
+any write to one of the user's recipes, tags or ingredients. Bumping it is a
+single INCR, and every key built with the old generation simply stops being
+read and expires on its own, so invalidation never scans keys.
+
+A miss is rebuilt by one worker only: the first one to take the key's lock
+builds the response while the others poll for it (stampede protection).
+
+The same generation makes a strong ETag: a request whose If-None-Match
+still matches gets a 304 without touching the database or a serializer.
+
+Image URLs that expire (presigned ones of core/s3.py) also key both on the
+storage's current URL epoch, so no response outlives the URLs it embeds.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,   # seconds a cached response is kept
+    'LOCK_TTL': 10,   # seconds before a crashed builder's lock expires
+    'LOCK_WAIT': 5,   # seconds a worker waits for another one's build
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def get_setting(name):
+    """Return a RESPONSE_CACHE setting, falling back to the default."""
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('CACHE_ALIAS')]
+
+
+def _generation_key(user_id):
+    return f'respcache:gen:{user_id}'
+
+
+def get_generation(user_id):
+    """Return the current cache generation of the user."""
+    cache = get_cache()
+    generation = cache.get(_generation_key(user_id))
+    if generation is None:
+        # start past any value an evicted counter could have reached
+        cache.add(_generation_key(user_id), time.time_ns(), timeout=None)
+        generation = cache.get(_generation_key(user_id))
+
+    return generation
+
+
+def bump_generation(user_id):
+    """Invalidate every cached response of the user in O(1)."""
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(user_id))
+    except ValueError:   # missing key
+        get_generation(user_id)
+
+
+def bump_generation_on_write(user_id):
+    """Bump the generation now and again when the transaction commits."""
+    bump_generation(user_id)
+    # a read racing with an open transaction can cache the old rows under
+    # the new generation, the bump on commit retires that entry too
+    transaction.on_commit(functools.partial(bump_generation, user_id))
+
+
+def normalize_params(query_params, list_params=()):
+    """Return query params as a canonical string for cache keys.
+
+    Keys are sorted and comma separated id lists in list_params are sorted
+    and deduplicated, so ?tags=2,1 and ?tags=1,2,2 share one entry.
+    """
+    parts = []
+    for key in sorted(query_params):
+        values = query_params.getlist(key)
+        if key in list_params:
+            values = sorted({
+                item.strip()
+                for value in values
+                for item in value.split(',')
+                if item.strip()
+            })
+        parts.append(f'{key}={",".join(values)}')
+
+    return '&'.join(parts)
+
+
+def url_epoch():
+    """Return the image storage's URL epoch, '' if its URLs don't expire."""
+    storage = Recipe._meta.get_field('image').storage
+    epoch = getattr(storage, 'url_epoch', None)
+    return '' if epoch is None else epoch()
+
+
+def response_cache_key(user_id, endpoint, params):
+    """Return the cache key of a list response."""
+    digest = hashlib.md5(params.encode()).hexdigest()
+    generation = get_generation(user_id)
+    epoch = url_epoch()
+    return f'respcache:{user_id}:{generation}:{epoch}:{endpoint}:{digest}'
+
+
+def get_or_build(key, build):
+    """Return the cached value of key, building it once on a miss."""
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, timeout=get_setting('LOCK_TTL'))
+    deadline = time.monotonic() + get_setting('LOCK_WAIT')
+    while not locked and time.monotonic() < deadline:
+        # another worker is building this key, wait for its result
+        time.sleep(get_setting('POLL_INTERVAL'))
+        value = cache.get(key)
+        if value is not None:
+            return value
+        locked = cache.add(lock_key, 1, timeout=get_setting('LOCK_TTL'))
+
+    try:
+        value = build()
+        if value is not None:
+            cache.set(key, value, timeout=get_setting('TTL'))
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    return value
+
+
+class CachedListMixin:
+    """Serve list responses from the per-user response cache."""
+    cache_list_params = ()   # query params holding comma separated ids
+
+    def list(self, request, *args, **kwargs):
+        """Return the cached list response, building it on a miss."""
+        params = normalize_params(request.query_params, self.cache_list_params)
+        key = response_cache_key(request.user.id, self.basename, params)
+
+        response = None
+
+        def build():
+            nonlocal response
+            response = super(CachedListMixin, self).list(
+                request, *args, **kwargs
+            )
+            if response.status_code != 200:
+                return None   # errors are returned, never cached
+            return response.data
+
+        data = get_or_build(key, build)
+        if response is not None:
+            return response
+
+        return Response(data)
+
+
+class ETagMixin:
+    """Answer conditional GETs on list routes with a 304.
+
+    Wrap other GET actions with conditional_response() the same way.
+    """
+    cache_list_params = ()
+
+    def get_etag(self, request):
+        """Return the strong ETag of the response to request."""
+        params = normalize_params(request.query_params, self.cache_list_params)
+        # read the generation before building the body, so a write racing
+        # with this request can only make the ETag older, never newer
+        generation = get_generation(request.user.id)
+        fmt = request.accepted_renderer.format
+        raw = (f'{request.user.id}:{generation}:{url_epoch()}:'
+               f'{request.path}:{params}:{fmt}')
+        return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Return a 304 if the client's copy is current, else handler()."""
+        etag = self.get_etag(request)
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            # "*" matches any current representation, so it only turns a
+            # response into a 304 once the lookup found the resource
+            if '*' in client_etags and response.status_code == 200:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Return the list, or a 304 if it did not change."""
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def recipe_data_changed(sender, instance, **kwargs):
+    """Invalidate the cached responses of the owner of instance."""
+    bump_generation_on_write(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, **kwargs):
+    """Invalidate the cached responses when tags or ingredients move."""
+    if action.startswith('post_'):
+        bump_generation_on_write(instance.user_id)
@@ -0,0 +1,140 @@
+"""
+Streaming export of a user's recipe library.
+
+Recipes are read through a server-side cursor in chunks; each chunk gets its
+tags and ingredients with one query per relation and is encoded, and
+optionally gzipped, before the next one is fetched. Nothing holds more than
+one chunk, so memory stays flat however large the library is.
+"""
+import csv
+import io
+import json
+import zlib
+
+from recipe import serializers
+from recipe.fast_serializers import FastRecipeSerializer
+
+
+CHUNK_SIZE = 2000
+FORMATS = {   # name -> (content type, file extension)
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+CSV_LIST_SEPARATOR = ';'   # between tag or ingredient names in a cell
+CSV_ESCAPE = '\\'   # before a separator or escape that is part of a name
+
+
+class ExportRecipeSerializer(FastRecipeSerializer):
+    """Fast path producing the output of RecipeDetailSerializer.
+
+    Image variants are left out, they are derived files and their URLs
+    are of no use to an import.
+    """
+    output_fields = [
+        field for field in serializers.RecipeDetailSerializer.Meta.fields
+        if field != 'image_variants'
+    ]
+    fields = tuple(
+        field for field in FastRecipeSerializer.fields
+        if field != 'image_variants'
+    ) + ('description',)
+
+
+def iter_chunks(rows, size=CHUNK_SIZE):
+    """Yield lists of at most size items from rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_recipes(queryset, chunk_size=CHUNK_SIZE):
+    """Yield serialized recipes of queryset, one chunk in memory at a time."""
+    # iterator() reads through a server-side cursor on PostgreSQL
+    rows = queryset.order_by('id').values(
+        *ExportRecipeSerializer.fields,
+    ).iterator(chunk_size=chunk_size)
+    for chunk in iter_chunks(rows, chunk_size):
+        yield ExportRecipeSerializer(chunk).data
+
+
+def encode_ndjson(chunks):
+    """Yield one JSON document per recipe, a line each."""
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps(recipe, ensure_ascii=False) + '\n' for recipe in chunk
+        ).encode()
+
+
+def join_names(names):
+    """Return names as one CSV cell, escaping separators in the names."""
+    return CSV_LIST_SEPARATOR.join(
+        name.replace(CSV_ESCAPE, CSV_ESCAPE * 2)
+        .replace(CSV_LIST_SEPARATOR, CSV_ESCAPE + CSV_LIST_SEPARATOR)
+        for name in names
+    )
+
+
+def split_names(cell):
+    """Return the names of a CSV cell written by join_names()."""
+    names, name = [], []
+    chars = iter(cell)
+    for char in chars:
+        if char == CSV_ESCAPE:
+            escaped = next(chars, '')
+            if escaped not in (CSV_ESCAPE, CSV_LIST_SEPARATOR):
+                name.append(char)   # a lone backslash is kept as it is
+            name.append(escaped)
+        elif char == CSV_LIST_SEPARATOR:
+            names.append(''.join(name))
+            name = []
+        else:
+            name.append(char)
+    names.append(''.join(name))
+    return names
+
+
+def _csv_row(recipe, fields):
+    return [
+        join_names(item['name'] for item in recipe[field])
+        if isinstance(recipe[field], list) else recipe[field]
+        for field in fields
+    ]
+
+
+def encode_csv(chunks, fields=ExportRecipeSerializer.output_fields):
+    """Yield a CSV header and then the rows of each chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks:
+        for recipe in chunk:
+            writer.writerow(_csv_row(recipe, fields))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():   # no recipes, just the header
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(parts, level=6):
+    """Gzip an iterable of bytes on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # 31: gzip
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_recipes(queryset, fmt='ndjson', compress=False,
+                   chunk_size=CHUNK_SIZE):
+    """Return an iterator of the encoded export of queryset."""
+    encode = encode_csv if fmt == 'csv' else encode_ndjson
+    parts = encode(iter_recipes(queryset, chunk_size))
+    return gzip_stream(parts) if compress else parts
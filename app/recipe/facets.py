@@ -0,0 +1,106 @@
+"""
+Facet counts for recipe filtering UIs.
+
+Given the filtered recipes of a request, returns how many of them carry each
+tag and ingredient and fall into each time_minutes bucket and price range.
+That is three grouped queries whatever the number of facet values: one per
+relation, grouped on the through table, and one conditional aggregate for
+the total and every bucket.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+from core.models import Recipe
+
+
+TIME_BUCKETS = (   # [min, max) in minutes, None is unbounded
+    (None, 15),
+    (15, 30),
+    (30, 60),
+    (60, None),
+)
+PRICE_RANGES = (
+    (None, Decimal('5.00')),
+    (Decimal('5.00'), Decimal('10.00')),
+    (Decimal('10.00'), Decimal('20.00')),
+    (Decimal('20.00'), None),
+)
+
+
+def _bucket_filter(field, low, high):
+    query = Q()
+    if low is not None:
+        query &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        query &= Q(**{f'{field}__lt': high})
+    return query
+
+
+def _bucket_key(field, index):
+    return f'{field}_{index}'
+
+
+def _format(value):
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def related_counts(field, recipe_ids):
+    """Return [{'id', 'name', 'count'}] for an m2m field, most used first."""
+    through = getattr(Recipe, field).through
+    target = getattr(Recipe, field).field.m2m_reverse_field_name()
+    rows = through.objects.filter(
+        recipe_id__in=recipe_ids,
+    ).values(
+        f'{target}_id',
+        f'{target}__name',
+    ).annotate(
+        count=Count('*'),
+    ).order_by('-count', f'{target}__name')
+
+    return [
+        {
+            'id': row[f'{target}_id'],
+            'name': row[f'{target}__name'],
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+
+
+def bucket_counts(queryset):
+    """Return the total and the count of every bucket in one query."""
+    aggregates = {'count': Count('id')}
+    for field, buckets in (('time_minutes', TIME_BUCKETS),
+                           ('price', PRICE_RANGES)):
+        for index, (low, high) in enumerate(buckets):
+            aggregates[_bucket_key(field, index)] = Count(
+                'id',
+                filter=_bucket_filter(field, low, high),
+            )
+    counts = queryset.aggregate(**aggregates)
+
+    result = {'count': counts['count']}
+    for field, buckets in (('time_minutes', TIME_BUCKETS),
+                           ('price', PRICE_RANGES)):
+        result[field] = [
+            {
+                'min': _format(low),
+                'max': _format(high),
+                'count': counts[_bucket_key(field, index)],
+            }
+            for index, (low, high) in enumerate(buckets)
+        ]
+
+    return result
+
+
+def build_facets(queryset):
+    """Return the facet counts of the recipes in queryset."""
+    queryset = queryset.order_by()   # ordering is meaningless for counts
+    recipe_ids = queryset.values('id')   # used as a subquery, not fetched
+
+    facets = bucket_counts(queryset)
+    facets['tags'] = related_counts('tags', recipe_ids)
+    facets['ingredients'] = related_counts('ingredients', recipe_ids)
+    return facets
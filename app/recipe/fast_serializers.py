@@ -0,0 +1,118 @@
+"""
+Read-only fast path serializers.
+
+DRF serializers build a model instance per row and then walk every field's
+to_representation(), plus a nested serializer per related object. For large
+read-only lists that is where most of the CPU goes. These serializers build
+the same output straight from values() rows and related rows fetched as
+plain tuples, grouped per recipe in one query per relation.
+
+Their output must stay identical to the DRF serializer they stand in for,
+test_fast_serializers.py compares the two field for field.
+"""
+from decimal import Decimal
+
+from rest_framework.response import Response
+
+from core.models import Recipe
+
+from recipe import serializers
+from recipe.images import variant_urls
+
+
+def format_decimal(value, decimal_places):
+    """Format value the way DRF's DecimalField renders it by default."""
+    quantum = Decimal(1).scaleb(-decimal_places)
+    return '{:f}'.format(value.quantize(quantum))
+
+
+def group_related(field, recipe_ids):
+    """Return {recipe_id: [{'id': ..., 'name': ...}, ...]} for an m2m field."""
+    through = getattr(Recipe, field).through
+    target = getattr(Recipe, field).field.m2m_reverse_field_name()
+    rows = through.objects.filter(
+        recipe_id__in=recipe_ids,
+    ).order_by('pk').values_list(
+        'recipe_id',
+        f'{target}_id',
+        f'{target}__name',
+    )
+
+    grouped = {}
+    for recipe_id, related_id, name in rows:
+        grouped.setdefault(recipe_id, []).append(
+            {'id': related_id, 'name': name},
+        )
+
+    return grouped
+
+
+class FastRecipeSerializer:
+    """Fast path producing the output of RecipeSerializer(many=True)."""
+    output_fields = serializers.RecipeSerializer.Meta.fields
+    related_fields = ('tags', 'ingredients')
+    fields = (   # values()
+        'id', 'title', 'time_minutes', 'price', 'link', 'image_variants',
+    )
+    price_places = Recipe._meta.get_field('price').decimal_places
+
+    def __init__(self, rows, context=None):
+        self.rows = rows   # dicts from Recipe.objects.values(*fields)
+        self.request = (context or {}).get('request')
+
+    @property
+    def data(self):
+        """Return the list of recipe dicts."""
+        rows = list(self.rows)
+        if not rows:
+            return []
+
+        ids = [row['id'] for row in rows]
+        related = {
+            field: group_related(field, ids) for field in self.related_fields
+        }
+        price_places = self.price_places
+
+        data = []
+        for row in rows:
+            item = {}
+            for field in self.output_fields:
+                if field in related:
+                    item[field] = related[field].get(row['id'], [])
+                elif field == 'price':
+                    item[field] = format_decimal(row[field], price_places)
+                elif field == 'image_variants':
+                    item[field] = variant_urls(row[field], self.request)
+                else:
+                    item[field] = row[field]
+            data.append(item)
+
+        return data
+
+
+class FastListMixin:
+    """Serve selected list actions through a fast path serializer."""
+    fast_serializer_classes = {}   # action -> fast serializer class
+
+    def list(self, request, *args, **kwargs):
+        """Return the list, through the fast path if the action has one."""
+        fast_serializer_class = self.fast_serializer_classes.get(self.action)
+        if fast_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = list(fast_serializer_class.fields)
+        if self.paginator is not None:   # the cursor reads its ordering keys
+            ordering = self.paginator.get_ordering(request, queryset, self)
+            fields += [
+                key.lstrip('-') for key in ordering
+                if key.lstrip('-') not in fields
+            ]
+        rows = queryset.values(*fields)
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            data = fast_serializer_class(page, context).data
+            return self.get_paginated_response(data)
+
+        return Response(fast_serializer_class(rows, context).data)
@@ -0,0 +1,252 @@
+"""
+Boolean tag and ingredient filter expressions for recipes.
+
+    ?q=tag:vegan AND tag:dinner AND NOT ingredient:peanuts
+    ?q=(tag:breakfast OR tag:brunch) -ingredient:"peanut butter"
+
+Terms are tag:<name> or ingredient:<name> (case-insensitive, quote names
+with spaces). They combine with AND, OR, NOT (or a leading -) and
+parentheses; AND binds tighter than OR and is implied between adjacent
+terms.
+
+Every name is resolved to ids up front, one query per kind, and each term
+compiles to an EXISTS probe of the (recipe_id, tag_id) unique index of the
+through table. Unlike a join on the relation that needs DISTINCT to undo
+the fan-out, the recipe query stays one row per recipe.
+"""
+import re
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.translation import gettext as _
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+KINDS = {   # term prefix -> (m2m field on Recipe, related model)
+    'tag': ('tags', Tag),
+    'ingredient': ('ingredients', Ingredient),
+}
+MAX_TERMS = 50
+MAX_DEPTH = 50   # NOTs and parentheses, bounds the parser's recursion
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+class FilterSyntaxError(ValueError):
+    """Raised for an expression that can't be parsed."""
+
+
+def tokenize(text):
+    """Split text into ('(' | ')' | 'word' | 'quoted', value) tokens."""
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise FilterSyntaxError(_('Unbalanced quotes.'))
+        opening, closing, quoted, word = match.groups()
+        if opening:
+            tokens.append(('(', opening))
+        elif closing:
+            tokens.append((')', closing))
+        elif quoted is not None:
+            tokens.append(('quoted', re.sub(r'\\(.)', r'\1', quoted)))
+        else:
+            tokens.append(('word', word))
+        pos = match.end()
+
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser producing a tuple AST.
+
+    Nodes are ('and', left, right), ('or', left, right), ('not', node) and
+    ('term', kind, name).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.terms = 0
+        self.depth = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterSyntaxError(_('Empty expression.'))
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise FilterSyntaxError(
+                _('Unexpected "%s".') % self.peek()[1],
+            )
+        return node
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise FilterSyntaxError(_('Unexpected end of expression.'))
+        self.pos += 1
+        return token
+
+    def enter(self):
+        """Count one more level of nesting, which must stay in bounds."""
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise FilterSyntaxError(
+                _('Expressions nest at most %d levels deep.') % MAX_DEPTH,
+            )
+
+    def is_keyword(self, keyword):
+        token = self.peek()
+        return (
+            token is not None
+            and token[0] == 'word'
+            and token[1].upper() == keyword
+        )
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.is_keyword('OR'):
+            self.next()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while True:
+            if self.is_keyword('AND'):
+                self.next()
+            elif self.peek() is None or self.peek()[0] == ')' \
+                    or self.is_keyword('OR'):
+                return node
+            node = ('and', node, self.parse_not())   # AND may be implied
+
+    def parse_not(self):
+        token = self.peek()
+        if self.is_keyword('NOT'):
+            self.next()
+        elif token is not None and token[0] == 'word' \
+                and token[1].startswith('-') and len(token[1]) > 1:
+            self.tokens[self.pos] = ('word', token[1][1:])
+        else:
+            return self.parse_atom()
+        self.enter()
+        node = ('not', self.parse_not())
+        self.depth -= 1
+        return node
+
+    def parse_atom(self):
+        kind, value = self.next()
+        if kind == '(':
+            self.enter()
+            node = self.parse_or()
+            if self.next()[0] != ')':
+                raise FilterSyntaxError(_('Missing ")".'))
+            self.depth -= 1
+            return node
+        if kind != 'word' or ':' not in value:
+            raise FilterSyntaxError(
+                _('Expected tag:<name> or ingredient:<name>, got "%s".')
+                % value,
+            )
+
+        term_kind, name = value.split(':', 1)
+        term_kind = term_kind.lower()
+        if term_kind not in KINDS:
+            raise FilterSyntaxError(_('Unknown term "%s".') % term_kind)
+        if not name:   # tag:"two words"
+            token = self.next()
+            if token[0] != 'quoted':
+                raise FilterSyntaxError(_('Missing name after "%s".') % value)
+            name = token[1]
+
+        self.terms += 1
+        if self.terms > MAX_TERMS:
+            raise FilterSyntaxError(
+                _('At most %d terms are allowed.') % MAX_TERMS,
+            )
+        return ('term', term_kind, name)
+
+
+def parse(text):
+    """Return the AST of text, raising FilterSyntaxError if invalid."""
+    return Parser(tokenize(text)).parse()
+
+
+def _collect_names(node, names):
+    if node[0] == 'term':
+        names[node[1]].add(node[2].lower())
+    else:
+        for child in node[1:]:
+            _collect_names(child, names)
+
+
+def _resolve_names(user, names):
+    """Return {kind: {lower name: {ids}}}, one query per kind used."""
+    resolved = {}
+    for kind, kind_names in names.items():
+        resolved[kind] = {}
+        if not kind_names:
+            continue
+        query = Q()
+        for name in kind_names:
+            query |= Q(name__iexact=name)
+        model = KINDS[kind][1]
+        rows = model.objects.filter(query, user=user).values_list('id', 'name')
+        for obj_id, name in rows:
+            resolved[kind].setdefault(name.lower(), set()).add(obj_id)
+
+    return resolved
+
+
+def related_exists(field, ids):
+    """Return an EXISTS condition: the recipe is linked to one of ids."""
+    through = getattr(Recipe, field).through
+    target = getattr(Recipe, field).field.m2m_reverse_field_name()
+    return Exists(through.objects.filter(
+        recipe_id=OuterRef('pk'),
+        **{f'{target}_id__in': ids},
+    ))
+
+
+def assigned_exists(field):
+    """Return an EXISTS condition: the tag or ingredient is on a recipe."""
+    through = getattr(Recipe, field).through
+    source = getattr(Recipe, field).field.m2m_reverse_field_name()
+    return Exists(through.objects.filter(**{f'{source}_id': OuterRef('pk')}))
+
+
+def _compile(node, resolved):
+    op = node[0]
+    if op == 'term':
+        _, kind, name = node
+        ids = resolved[kind].get(name.lower())
+        if not ids:   # unknown name, nothing carries it
+            return Q(pk__in=[])
+        return Q(related_exists(KINDS[kind][0], sorted(ids)))
+    if op == 'not':
+        return ~_compile(node[1], resolved)
+    left = _compile(node[1], resolved)
+    right = _compile(node[2], resolved)
+    return left & right if op == 'and' else left | right
+
+
+def compile_filter(text, user):
+    """Return a Q filtering recipes of user by the expression text."""
+    try:
+        node = parse(text)
+    except FilterSyntaxError as exc:
+        raise ValidationError({'q': [str(exc)]})
+
+    names = {kind: set() for kind in KINDS}
+    _collect_names(node, names)
+    return _compile(node, _resolve_names(user, names))
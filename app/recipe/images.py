@@ -0,0 +1,179 @@
+"""
+Responsive variants of recipe images.
+
+Clients shouldn't download a multi-megabyte original to draw a thumbnail,
+so every uploaded image gets resized, recompressed copies (by default 128,
+512 and 1024 px on the long side, as WebP and JPEG). They are generated off
+the request path: once the upload's transaction commits, the recipe id is
+handed to a small pool of worker threads, and the upload response returns
+as soon as the original is stored. Recipe.image_variants stays {} until the
+variants are saved, and clients fall back to the original meanwhile.
+
+The generate_image_variants command fills in variants that are missing,
+e.g. after a worker process was killed with jobs still queued.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from PIL import Image, ImageOps, features
+
+from core.models import Recipe
+
+from recipe.cache import bump_generation_on_write
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SIZES': (128, 512, 1024),   # px on the long side
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,   # False generates in the committing thread
+}
+ENCODERS = {   # format -> (Pillow format, file extension, Pillow feature)
+    'jpeg': ('JPEG', 'jpg', 'jpg'),
+    'webp': ('WEBP', 'webp', 'webp'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_setting(name):
+    """Return an IMAGE_VARIANTS setting, falling back to the default."""
+    return getattr(settings, 'IMAGE_VARIANTS', {}).get(name, DEFAULTS[name])
+
+
+def supported_formats():
+    """Return the configured formats this Pillow build can encode."""
+    return [
+        fmt for fmt in get_setting('FORMATS')
+        if features.check(ENCODERS[fmt][2])
+    ]
+
+
+def variant_name(image_name, size, fmt):
+    """Return the file name of a variant of image_name."""
+    stem = os.path.splitext(image_name)[0]
+    return f'{stem}/{size}.{ENCODERS[fmt][1]}'
+
+
+def variant_urls(variants, request=None):
+    """Return {size: {format: url}} for stored variants."""
+    storage = Recipe._meta.get_field('image').storage
+    urls = {}
+    for size, names in variants.items():
+        urls[size] = {}
+        for fmt, name in names.items():
+            url = storage.url(name)
+            if request is not None:   # absolute, like DRF's ImageField
+                url = request.build_absolute_uri(url)
+            urls[size][fmt] = url
+
+    return urls
+
+
+def render_variants(image_file, sizes, formats, quality):
+    """Return {size: {format: bytes}} of image_file.
+
+    Sizes at or above the original's long side are skipped, images are
+    never upscaled.
+    """
+    with Image.open(image_file) as original:
+        # let the JPEG decoder scale down while decoding, much cheaper
+        # than decoding the full image and resizing it
+        original.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(original)
+
+    rendered = {}
+    for size in sorted(sizes, reverse=True):   # each from the one before
+        if size >= max(image.size):
+            continue
+        image.thumbnail((size, size), Image.LANCZOS)
+        rendered[size] = {}
+        for fmt in formats:
+            pil_format = ENCODERS[fmt][0]
+            frame = image
+            if pil_format == 'JPEG' and image.mode != 'RGB':
+                frame = image.convert('RGB')   # no alpha or palettes
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, quality=quality, optimize=True)
+            rendered[size][fmt] = buffer.getvalue()
+
+    return rendered
+
+
+def generate_variants(recipe_id):
+    """Render and store the variants of a recipe's current image."""
+    recipe = Recipe.objects.only('id', 'user_id', 'image').filter(
+        pk=recipe_id,
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+
+    image_name = recipe.image.name
+    storage = recipe.image.storage
+    with recipe.image.open('rb') as image_file:
+        rendered = render_variants(
+            image_file,
+            get_setting('SIZES'),
+            supported_formats(),
+            get_setting('QUALITY'),
+        )
+
+    variants = {}
+    for size, encoded in rendered.items():
+        variants[str(size)] = {}
+        for fmt, data in encoded.items():
+            # the storage may store it under another name (content
+            # addressed ones do), the returned name is the one to keep
+            name = variant_name(image_name, size, fmt)
+            variants[str(size)][fmt] = storage.save(name, ContentFile(data))
+
+    # the image may have been replaced while this one was being rendered
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_variants=variants,
+    )
+    if updated:
+        bump_generation_on_write(recipe.user_id)
+
+
+def get_executor():
+    """Return the worker pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting('WORKERS'),
+                thread_name_prefix='image-variants',
+            )
+    return _executor
+
+
+def _run(recipe_id):
+    try:
+        generate_variants(recipe_id)
+    except Exception:
+        logger.exception('Generating variants of recipe %s failed', recipe_id)
+    finally:
+        connection.close()   # the worker thread's own connection
+
+
+def _submit(recipe_id):
+    if get_setting('ASYNC'):
+        get_executor().submit(_run, recipe_id)
+    else:
+        generate_variants(recipe_id)
+
+
+def schedule_variants(recipe_id):
+    """Generate the variants of a recipe's image after the commit."""
+    transaction.on_commit(lambda: _submit(recipe_id))
@@ -0,0 +1,211 @@
+"""
+Serving recipe images to their owners.
+
+The view checks that the requesting user owns a recipe referencing the
+file, then gets the bytes out without copying them through Python:
+
+- with MEDIA_SERVING['OFFLOAD'] = 'x-accel-redirect' (nginx) the response
+  only names an internal location under ACCEL_PREFIX, and with
+  'x-sendfile' (Apache, lighttpd) the file path, and the proxy sends the
+  file, handling Range itself;
+- otherwise the file is returned as a FileResponse, which the WSGI
+  server's wsgi.file_wrapper sends with os.sendfile(). Single byte ranges
+  are served as 206 the same way, from a file positioned at the start of
+  the range and limited to its length.
+
+Stored names never change content (uploads get new names, see
+core/storage.py and recipe_image_file_path()), so responses carry a year
+long immutable Cache-Control, private as they depend on the user, and
+Last-Modified for If-Modified-Since.
+
+Storages without local files (core/s3.py) are answered, after the same
+access check, with a redirect to the file's URL, a presigned one that the
+client downloads straight from the object store.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models.expressions import RawSQL
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseRedirect,
+)
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+from drf_spectacular.utils import extend_schema
+
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication
+from core.models import Recipe
+
+
+DEFAULTS = {
+    'OFFLOAD': None,   # None, 'x-accel-redirect' or 'x-sendfile'
+    'ACCEL_PREFIX': '/protected-media/',   # nginx internal location
+    'MAX_AGE': 365 * 24 * 60 * 60,
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+HAS_VARIANT_SQL = """
+EXISTS (
+    SELECT 1
+    FROM jsonb_each(image_variants) AS size,
+        jsonb_each(size.value) AS variant
+    WHERE variant.value #>> '{}' = %s
+)
+"""
+
+
+def get_setting(name):
+    """Return a MEDIA_SERVING setting, falling back to the default."""
+    return getattr(settings, 'MEDIA_SERVING', {}).get(name, DEFAULTS[name])
+
+
+class RangeFile:
+    """File positioned at offset, reading at most length bytes.
+
+    fileno() is passed through, so wsgi.file_wrapper implementations can
+    sendfile() from the current position for the Content-Length.
+    """
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single byte range header, inclusive.
+
+    Returns None when the header should be ignored (missing, malformed or
+    several ranges) and raises ValueError when it can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:   # the last end bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def user_can_read(user, name):
+    """Return whether one of the user's recipes references name."""
+    recipes = Recipe.objects.filter(user=user)
+    if recipes.filter(image=name).exists():
+        return True
+    # variants are looked up only when the name isn't an original
+    return recipes.exclude(image_variants={}).alias(
+        has_variant=RawSQL(HAS_VARIANT_SQL, (name,)),
+    ).filter(has_variant=True).exists()
+
+
+class MediaView(APIView):
+    """Serve a recipe image to the owner of a recipe using it."""
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(exclude=True)   # file downloads, not part of the API
+    def get(self, request, name):
+        """Return the file, a part of it or a 304."""
+        storage = Recipe._meta.get_field('image').storage
+        try:
+            path = storage.path(name)
+        except NotImplementedError:   # a remote storage
+            return self.redirect(request, storage, name)
+        except SuspiciousFileOperation:
+            raise Http404
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise Http404
+        if not user_can_read(request.user, name):
+            raise Http404   # the same as a missing file, nothing leaks
+
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime,
+        ):
+            response = HttpResponse(status=304)
+        elif get_setting('OFFLOAD'):
+            response = self.offload(name, path)
+        else:
+            response = self.send(request, path, stat.st_size, stat.st_mtime)
+
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = (
+            f'private, max-age={get_setting("MAX_AGE")}, immutable'
+        )
+        return response
+
+    def redirect(self, request, storage, name):
+        """Redirect to the storage's URL of name, once access is checked."""
+        if not user_can_read(request.user, name):
+            raise Http404
+        response = HttpResponseRedirect(storage.url(name))
+        # the URL expires, so the redirect mustn't outlive it in caches
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def offload(self, name, path):
+        """Return an empty response the proxy fills in with the file."""
+        content_type = mimetypes.guess_type(name)[0]
+        response = HttpResponse(
+            content_type=content_type or 'application/octet-stream',
+        )
+        if get_setting('OFFLOAD') == 'x-accel-redirect':
+            prefix = get_setting('ACCEL_PREFIX').rstrip('/')
+            response['X-Accel-Redirect'] = f'{prefix}/{name}'
+        else:
+            response['X-Sendfile'] = path
+        return response
+
+    def send(self, request, path, size, mtime):
+        """Return the file, or the requested range of it."""
+        header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and parse_http_date_safe(if_range) != int(mtime):
+            header = None   # changed since the part the client has
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        media_file = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(media_file)
+        else:
+            start, end = byte_range
+            response = FileResponse(
+                RangeFile(media_file, start, end - start + 1), status=206,
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
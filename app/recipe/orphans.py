@@ -0,0 +1,141 @@
+"""
+Garbage collection of recipe image files no recipe references.
+
+Replaced images, deleted recipes and their variants leave files behind.
+The referenced names (Recipe.image and every name in image_variants) are
+read from a server-side cursor in byte order, the files under the media
+directory are walked in the same order, and the two sorted streams are
+merged like a sort-merge join: a file is an orphan when the database
+stream has passed its name without a match. Neither side is ever held in
+memory, so the collector runs the same on millions of files.
+
+Files written in the last grace period are never collected. An upload is
+stored before the recipe row referencing it commits, and the content
+addressed storage touches a blob whenever an upload reuses it, so a young
+file may be referenced any moment now.
+"""
+import os
+import time
+from datetime import timedelta
+
+from django.db import connection
+
+from core.models import ImageBlob, Recipe
+
+
+DIRECTORY = 'uploads/recipe'
+GRACE = timedelta(days=1)
+
+# names under a prefix, in byte order (COLLATE "C") to match the file walk
+REFERENCED_SQL = """
+SELECT name FROM (
+    SELECT image AS name FROM core_recipe WHERE image <> ''
+    UNION
+    SELECT variant.value #>> '{}'
+    FROM core_recipe,
+        jsonb_each(image_variants) AS size,
+        jsonb_each(size.value) AS variant
+) names
+WHERE name LIKE %s
+ORDER BY name COLLATE "C"
+"""
+
+
+def referenced_names(directory=DIRECTORY, chunk_size=2000):
+    """Yield the names under directory the database references, sorted."""
+    prefix = directory.rstrip('/') + '/'
+    escaped = prefix.replace('\\', '\\\\').replace('%', r'\%') \
+        .replace('_', r'\_')
+    # a named cursor, rows are fetched chunk_size at a time
+    with connection.chunked_cursor() as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(REFERENCED_SQL, [escaped + '%'])
+        for (name,) in cursor:
+            yield name
+
+
+def iter_files(root, directory=DIRECTORY):
+    """Yield (name, DirEntry) of the files under directory, sorted by name.
+
+    Directories sort as their name plus '/', so the walk yields the names
+    in plain string order, the order of referenced_names().
+    """
+    def walk(path, name):
+        try:
+            entries = list(os.scandir(path))
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda e: e.name + '/' if e.is_dir() else e.name)
+        for entry in entries:
+            entry_name = f'{name}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, entry_name)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry_name, entry
+
+    yield from walk(os.path.join(root, directory), directory.rstrip('/'))
+
+
+def find_orphans(root, directory=DIRECTORY, grace=GRACE, names=None):
+    """Yield (name, path, size) of unreferenced files older than grace."""
+    if names is None:
+        names = referenced_names(directory)
+    names = iter(names)
+    cutoff = time.time() - grace.total_seconds()
+    referenced = next(names, None)
+    for name, entry in iter_files(root, directory):
+        while referenced is not None and referenced < name:
+            referenced = next(names, None)
+        if referenced == name:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime < cutoff:
+            yield name, entry.path, stat.st_size
+
+
+def collect_orphans(orphans, dry_run=False, rate=None, grace=GRACE,
+                    batch_size=500, report=None):
+    """Delete orphans, return (files, bytes) collected.
+
+    rate limits deletions per second; report, if given, is called with
+    the name and size of each orphan.
+    """
+    files = size = 0
+    deleted = []
+    started = time.monotonic()
+    for name, path, file_size in orphans:
+        if report is not None:
+            report(name, file_size)
+        if not dry_run:
+            # touched since the walk, e.g. reused by an upload meanwhile
+            cutoff = time.time() - grace.total_seconds()
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            deleted.append(name)
+            if len(deleted) >= batch_size:
+                _forget_blobs(deleted)
+                deleted = []
+        files += 1
+        size += file_size
+        if rate:   # sleep off any lead over the allowed pace
+            lead = files / rate - (time.monotonic() - started)
+            if lead > 0:
+                time.sleep(lead)
+
+    _forget_blobs(deleted)
+    return files, size
+
+
+def _forget_blobs(names):
+    if names:
+        ImageBlob.objects.filter(name__in=names, refcount=0).delete()
+
+
+def media_root():
+    """Return the file system directory recipe images are stored in."""
+    storage = Recipe._meta.get_field('image').storage
+    return storage.path('')   # NotImplementedError for remote storages
@@ -0,0 +1,220 @@
+"""
+Pagination for the recipe APIs.
+
+Cursor (keyset) pagination encodes the ordering values of the last row of a
+page into an opaque cursor, so the next page is fetched with
+WHERE id < <cursor> ORDER BY id DESC LIMIT n. Unlike page numbers there is
+no OFFSET, so page N costs the same as page 1, and rows inserted while a
+client is paging never shift items between pages.
+
+DRF's CursorPagination only keys on the first ordering field and pages
+through ties with an OFFSET, capped at offset_cutoff. Sorts on a value
+that many rows share (time, price, search rank) therefore key on the
+whole (value, id) pair, WHERE value > v OR (value = v AND id > i), which is
+unique, so no page ever needs an OFFSET.
+
+Only sorts backed by an index led by user_id are offered, anything else would
+read and sort all of a user's recipes for every page, and is rejected.
+"""
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, position):
+    """Return a Q of the rows after position in ordering.
+
+    position holds one value per ordering field; a row comes after it if
+    it is past the first value, or equal on it and past the second, etc.
+    """
+    after = Q()
+    equal = Q()
+    for order, value in zip(ordering, position):
+        field = order.lstrip('-')
+        lookup = '__lt' if order.startswith('-') else '__gt'
+        after |= equal & Q(**{field + lookup: value})
+        equal &= Q(**{field: value})
+    if len(ordering) == 1:
+        return after
+    # bounds the leading column too, so the index is range scanned from the
+    # position instead of filtered row by row
+    first = ordering[0]
+    bound = '__lte' if first.startswith('-') else '__gte'
+    return Q(**{first.lstrip('-') + bound: position[0]}) & after
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Cursor pagination for recipes, newest first."""
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering_param = 'ordering'
+    # sort -> ordering, each served by a (user_id, field, id) index on Recipe
+    # read forwards or backwards; id breaks ties between equal values
+    orderings = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'time_minutes': ('time_minutes', 'id'),
+        '-time_minutes': ('-time_minutes', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        """Return the requested sort, or search results by rank."""
+        sort = request.query_params.get(self.ordering_param)
+        if sort and self.orderings:
+            if sort not in self.orderings:
+                raise ValidationError({
+                    self.ordering_param: _('Sort by one of: %s.')
+                    % ', '.join(self.orderings),
+                })
+            return self.orderings[sort]
+
+        if 'search_rank' in queryset.query.annotations:
+            # equally good matches share a rank, id keeps the key unique
+            return ('-search_rank', '-id')
+
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page after (or before) the cursor's position."""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None
+        if self.cursor is not None and self.cursor.position is not None:
+            position = self._parse_position(queryset, self.cursor.position)
+
+        ordering = self.ordering
+        if reverse:   # the previous page, read backwards from the position
+            ordering = tuple(
+                order[1:] if order.startswith('-') else '-' + order
+                for order in ordering
+            )
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+
+        # one extra row tells whether there is a page past this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position(self.page[-1])
+        else:   # read backwards past the start, resume at the position
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position),
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position(self.page[0])
+        else:   # read forwards past the end, resume at the position
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=position),
+        )
+
+    def decode_cursor(self, request):
+        """Return the Cursor of the request, its position a list of values."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=tokens.get('p'))
+
+    def encode_cursor(self, cursor):
+        """Return the URL of the page at cursor."""
+        tokens = {'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded,
+        )
+
+    def _get_position(self, item):
+        """Return the ordering values of item, as strings for the cursor."""
+        position = []
+        for order in self.ordering:
+            field = order.lstrip('-')
+            value = item[field] if isinstance(item, dict) else \
+                getattr(item, field)
+            position.append(str(value))
+        return position
+
+    def _parse_position(self, queryset, position):
+        """Return the cursor's position converted to the ordering fields."""
+        if len(position) != len(self.ordering):   # e.g. another sort's
+            raise NotFound(self.invalid_cursor_message)
+
+        values = []
+        for order, value in zip(self.ordering, position):
+            name = order.lstrip('-')
+            try:
+                if name in queryset.query.annotations:
+                    field = queryset.query.annotations[name].output_field
+                else:
+                    field = queryset.model._meta.get_field(name)
+                values.append(field.to_python(value))
+            except (FieldDoesNotExist, DjangoValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        if self.orderings:
+            parameters.append({
+                'name': self.ordering_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Sort order, newest first (-id) by default.',
+                'schema': {'type': 'string', 'enum': list(self.orderings)},
+            })
+        return parameters
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """Cursor pagination for tags and ingredients, ordered by name."""
+    ordering = '-name'
+    orderings = {}   # by name only
+    # names are unique per user, so the cursor position is an exact key
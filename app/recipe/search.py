@@ -0,0 +1,62 @@
+"""
+Search helpers for the recipe APIs.
+
+Recipes are matched against Recipe.search_vector, a tsvector over the title,
+tag and ingredient names and description that database triggers keep up to
+date on every write, so a query is a GIN index lookup plus ranking of the
+matches rather than a scan of the user's recipes.
+
+Tags and ingredients are matched by name prefix or trigram similarity, both
+served by the (user_id, name gin_trgm_ops) index, for autocomplete.
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db.models import (
+    BigIntegerField,
+    Case,
+    F,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
+
+
+SEARCH_CONFIG = 'english'   # must match core_recipe_document() in 0008
+RANK_SCALE = 1000000   # ranks are paged as integers, see search_recipes()
+
+
+def search_recipes(queryset, text):
+    """Filter queryset to recipes matching text, annotated with search_rank.
+
+    text uses web search syntax: "chicken curry", "curry -beef", "a or b".
+    The rank is scaled to an integer so cursor pagination can compare it
+    exactly, floats don't survive the round trip through a cursor.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    rank = SearchRank(F('search_vector'), query) * Value(RANK_SCALE)
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=Cast(rank, BigIntegerField()),
+    )
+
+
+def search_names(queryset, text):
+    """Filter queryset to names starting with or similar to text.
+
+    Annotates search_rank like search_recipes(): prefix matches first, then
+    by trigram similarity, so "chi" finds "Chicken" and "chiken" does too.
+    """
+    prefix = Q(name__iregex=f'^{re.escape(text)}')
+    similarity = TrigramSimilarity('name', text) * Value(RANK_SCALE)
+    prefix_bonus = Case(
+        When(prefix, then=Value(RANK_SCALE)),
+        default=Value(0),
+    )
+    return queryset.filter(prefix | Q(name__trigram_similar=text)).annotate(
+        search_rank=Cast(similarity + prefix_bonus, BigIntegerField()),
+    )
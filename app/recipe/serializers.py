@@ -4,6 +4,9 @@ Serializers for recipe APIs
 serializer transforms queryset into a list of dict and then JsonRenderer turns the data into JSON
 which then being sent back to the client
 """
+from django.db import transaction
+from django.utils.translation import gettext as _
+
 from rest_framework import serializers
 
 from core.models import (
@@ -12,8 +15,30 @@ from core.models import (
     Ingredient,
 )
 
+from recipe.images import variant_urls
+from recipe.uploads import InvalidImage, sanitize_image
+
+
+class UniqueNameSerializer(serializers.ModelSerializer):
+    """Base serializer for objects whose name is unique per user."""
+
+    def validate_name(self, value):
+        """Reject renaming to a name the user already has."""
+        if self.instance is None:   # nested in a recipe, names are looked up
+            return value
+        exists = self.Meta.model.objects.filter(
+            user=self.instance.user,
+            name=value,
+        ).exclude(id=self.instance.id).exists()
+        if exists:
+            raise serializers.ValidationError(
+                _('An item with this name already exists.'),
+            )
+
+        return value
 
-class IngredientSerializer(serializers.ModelSerializer):
+
+class IngredientSerializer(UniqueNameSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -22,7 +47,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UniqueNameSerializer):
     """Serializer for tags."""
 
     class Meta:
@@ -31,43 +56,124 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredients with the number of recipes using them."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for tags with the number of recipes using them."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Read only field rendering stored image variants as URLs."""
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
+class UploadedImageField(serializers.ImageField):
+    """Image field validating uploads with recipe/uploads.py.
+
+    Unlike ImageField, which decodes the whole upload to verify it, the
+    header is checked against the size limits before anything is decoded.
+    """
+
+    def to_internal_value(self, data):
+        # FileField checks the name and size, without opening the file
+        upload = serializers.FileField.to_internal_value(self, data)
+        try:
+            return sanitize_image(upload)
+        except InvalidImage as exc:
+            raise serializers.ValidationError(str(exc))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes."""
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_variants = ImageVariantsField()   # {size: {format: url}}
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'title', 'time_minutes', 'price', 'link', 'tags',
-            'ingredients',
+            'ingredients', 'image_variants',
         ]
         read_only_fields = ['id']
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handle getting or creating tags as needed."""
+    def _get_or_create_objects(self, model, items):
+        """Return the user's objects named in items, creating missing ones."""
         auth_user = self.context['request'].user
-        # logic to save the tags to database
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(   # it gets the values if the data exists, otherwise, create
-                user=auth_user,
-                **tag,   # unpack the dictionary tag into keyword arguments
+        names = list(dict.fromkeys(item['name'] for item in items))
+        if not names:
+            return []
+
+        # one lookup for every name instead of one get_or_create per item
+        objs = list(model.objects.filter(user=auth_user, name__in=names))
+        missing = set(names) - {obj.name for obj in objs}
+        if missing:
+            # one INSERT ... ON CONFLICT DO NOTHING, a concurrent request
+            # creating the same name hits the (user, name) unique constraint
+            # and we pick its row up below instead of adding a duplicate
+            model.objects.bulk_create(
+                [model(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True,
             )
-            recipe.tags.add(tag_obj)
-            # Django creates a separate "through" table that records the relationships
-            # between Recipes and Tags. Each row in this table represents one relationship,
-            # i.e., a particular Tag being associated with a particular Recipe.
+            objs += model.objects.filter(user=auth_user, name__in=missing)
+
+        return objs
+
+    def _add_related(self, recipe, field, objs):
+        """Attach objs to recipe with a single bulk insert of through rows."""
+        if not objs:
+            return
+        through = getattr(Recipe, field).through
+        target = getattr(Recipe, field).field.m2m_reverse_field_name()  # 'tag'
+        through.objects.bulk_create(
+            [through(recipe=recipe, **{target: obj}) for obj in objs],
+            ignore_conflicts=True,
+        )
+
+    def _set_related(self, recipe, field, objs):
+        """Replace the related objs of recipe, writing changed rows only."""
+        through = getattr(Recipe, field).through
+        target = getattr(Recipe, field).field.m2m_reverse_field_name()
+        # served from the prefetch cache when the view loaded the relation
+        current_ids = {obj.id for obj in getattr(recipe, field).all()}
+        new_ids = {obj.id for obj in objs}
+
+        removed_ids = current_ids - new_ids
+        if removed_ids:   # one DELETE for every dropped row
+            through.objects.filter(
+                recipe=recipe,
+                **{f'{target}_id__in': removed_ids},
+            ).delete()
+
+        added = [obj for obj in objs if obj.id not in current_ids]
+        self._add_related(recipe, field, added)   # one INSERT for the rest
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handle getting or creating tags as needed."""
+        tag_objs = self._get_or_create_objects(Tag, tags)
+        self._add_related(recipe, 'tags', tag_objs)
+        # Django creates a separate "through" table that records the relationships
+        # between Recipes and Tags. Each row in this table represents one relationship,
+        # i.e., a particular Tag being associated with a particular Recipe.
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = self._get_or_create_objects(Ingredient, ingredients)
+        self._add_related(recipe, 'ingredients', ingredient_objs)
 
+    @transaction.atomic   # readers see the recipe and its relations at once
     def create(self, validated_data):  # overridden and called auto in POST request
         """Create a recipe."""  # validated_data is a dict
         tags = validated_data.pop('tags', [])   # tags = a list of dicts
@@ -78,23 +184,31 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):  # overridden and called auto in PATCH request
         """Update recipe."""  # the default .update() method does not support writable nested fields
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
 
         if tags is not None:
-            instance.tags.clear()   # clear up all the existing tags in the recipe
-            self._get_or_create_tags(tags, instance)
+            tag_objs = self._get_or_create_objects(Tag, tags)
+            self._set_related(instance, 'tags', tag_objs)
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            ingredient_objs = self._get_or_create_objects(
+                Ingredient,
+                ingredients,
+            )
+            self._set_related(instance, 'ingredients', ingredient_objs)
 
         for attr, value in validated_data.items():   # the rest of validate data
             setattr(instance, attr, value)
 
-        instance.save()
+        # only the columns the request changed: the instance was read before
+        # this transaction, and writing back its image or image_variants
+        # would undo a concurrent move_batch() or generate_variants()
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
         return instance
 
 
@@ -107,11 +221,53 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
+    image = UploadedImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_variants']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}} 
+
+    def update(self, instance, validated_data):
+        """Store a new image, its variants are generated later."""
+        instance.image = validated_data['image']
+        instance.image_variants = {}   # those of the previous image
+        instance.save(update_fields=['image', 'image_variants'])
+        return instance
+
 
 
+
+class BatchOperationSerializer(serializers.Serializer):
+    """Serializer for one operation of a recipe batch."""
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False, default=dict)   # recipe fields
+
+    def validate(self, attrs):
+        """Require the id of the recipe to update or delete."""
+        if attrs['op'] != 'create' and 'id' not in attrs:
+            raise serializers.ValidationError(
+                {'id': _('This field is required.')},
+            )
+        return attrs
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of recipe operations."""
+    MAX_OPERATIONS = 500
+
+    mode = serializers.ChoiceField(
+        choices=['atomic', 'best_effort'],
+        default='atomic',
+    )
+    operations = BatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        """Limit the size of a batch."""
+        if len(value) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                _('At most %d operations per batch.') % self.MAX_OPERATIONS,
+            )
+        return value
@@ -0,0 +1,131 @@
+"""
+Moving stored recipe images into the sharded directory layout.
+
+New uploads are named by recipe_image_file_path() in the layout of
+RECIPE_IMAGE_SHARD_LEVELS; images stored before are moved in batches
+without downtime. For every image of a batch the file, and its variants,
+get a hard link at the new name, the rows are pointed at the new names in
+one transaction, and the old names are unlinked only once that commits.
+At any moment the name a row holds exists on disk, and a crash leaves at
+worst an extra link for the orphan collector.
+
+A link keeps the file's old mtime, so new links are touched: a collector
+run reading the references from before the move commits sees the new name
+as unreferenced, and must find it inside its grace period.
+"""
+import errno
+import os
+
+from django.db import transaction
+
+from core.models import ImageBlob, Recipe
+from core.storage import shard_name
+
+from recipe.cache import bump_generation_on_write
+from recipe.images import variant_name
+from recipe.orphans import DIRECTORY
+
+
+BATCH_SIZE = 500
+
+
+def target_name(name, levels=None, directory=DIRECTORY):
+    """Return the name of image name in the sharded layout."""
+    stem, ext = os.path.splitext(os.path.basename(name))
+    return shard_name(directory, stem, ext, levels)
+
+
+def iter_batches(levels=None, batch_size=BATCH_SIZE, directory=DIRECTORY):
+    """Yield lists of the image names not in the layout, in name order."""
+    names = Recipe.objects.filter(
+        image__startswith=directory.rstrip('/') + '/',
+    ).values_list('image', flat=True).distinct().order_by('image')
+
+    last = ''
+    while True:
+        page = list(names.filter(image__gt=last)[:batch_size])
+        if not page:
+            return
+        last = page[-1]
+        batch = [name for name in page if target_name(name, levels) != name]
+        if batch:
+            yield batch
+
+
+def _link(storage, old, new):
+    """Hard link new to old, return whether new now holds old's file."""
+    old_path, new_path = storage.path(old), storage.path(new)
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.link(old_path, new_path)
+    except FileExistsError:   # e.g. linked by an interrupted run
+        if not os.path.samefile(old_path, new_path):
+            return False
+    except FileNotFoundError:
+        return False
+    os.utime(new_path)   # young, out of reach of the orphan collector
+    return True
+
+
+def _unlink(storage, names):
+    for name in names:
+        path = storage.path(name)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        try:
+            os.rmdir(os.path.dirname(path))   # e.g. the variants' directory
+        except OSError as exc:
+            # in use, or removed meanwhile; uploads make it again if needed
+            if exc.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                raise
+
+
+def move_batch(names, levels=None):
+    """Move the images named in names and their variants to the layout.
+
+    Returns the number of images moved; images whose file is missing or
+    whose new name is taken by another file are left where they are.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    moved, old_files, user_ids = 0, [], set()
+    with transaction.atomic():
+        rows = Recipe.objects.filter(image__in=names).values_list(
+            'id', 'user_id', 'image', 'image_variants',
+        ).select_for_update()
+        by_image = {}
+        for row in rows:
+            by_image.setdefault(row[2], []).append(row)
+
+        for old, image_rows in by_image.items():
+            new = target_name(old, levels)
+            if not _link(storage, old, new):
+                continue
+            old_files.append(old)
+            moved += 1
+            for recipe_id, user_id, _, variants in image_rows:
+                renamed = {}
+                for size, formats in variants.items():
+                    renamed[size] = {}
+                    for fmt, name in formats.items():
+                        # variants named after the image move along,
+                        # content addressed ones are left alone
+                        if name == variant_name(old, size, fmt) and \
+                                _link(storage, name,
+                                      variant_name(new, size, fmt)):
+                            old_files.append(name)
+                            name = variant_name(new, size, fmt)
+                        renamed[size][fmt] = name
+                Recipe.objects.filter(id=recipe_id).update(
+                    image=new, image_variants=renamed,
+                )
+                user_ids.add(user_id)
+
+        # the counting triggers left the old names at zero references
+        ImageBlob.objects.filter(name__in=old_files, refcount=0).delete()
+        for user_id in user_ids:
+            bump_generation_on_write(user_id)   # cached image URLs
+        transaction.on_commit(lambda: _unlink(storage, set(old_files)))
+
+    return moved
@@ -0,0 +1,178 @@
+"""
+Delta sync of a user's recipes, tags and ingredients.
+
+The cursor is a transaction id horizon: every transaction with an id below
+it had finished when the cursor was issued, so all of its changes were
+visible. A sync returns the changes logged by transactions in
+[cursor, horizon) and the new horizon as the next cursor; a transaction
+that commits late has an id at or above the horizon and is picked up by
+the next sync instead of being skipped.
+
+The change log only keeps the last retention period (see the
+prune_change_log command). A cursor from before the pruned horizon may
+have missed changes, so the sync answers 410 and the client starts over
+with a full sync.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.models import (
+    Change,
+    ChangeLogHorizon,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+from recipe import serializers
+
+
+SYNC_MODELS = {   # change log name -> (response key, model, serializer)
+    'recipe': ('recipes', Recipe, serializers.RecipeDetailSerializer),
+    'tag': ('tags', Tag, serializers.TagSerializer),
+    'ingredient': (
+        'ingredients', Ingredient, serializers.IngredientSerializer,
+    ),
+}
+RETENTION = timedelta(days=30)
+
+
+class ResyncRequired(APIException):
+    """Raised when the changes since a cursor have been pruned."""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Cursor expired, a full sync is required.'
+    default_code = 'resync_required'
+
+
+def current_horizon():
+    """Return the id below which every transaction has finished."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def pruned_horizon():
+    """Return the id below which the change log has been pruned."""
+    horizon = ChangeLogHorizon.objects.filter(pk=1).first()
+    return horizon.txid if horizon else 0
+
+
+def prune_changes(before):
+    """Delete the changes logged before the datetime before.
+
+    Everything below the last pruned id goes, so the log stays complete
+    from the recorded horizon on. The horizon never passes the current one,
+    so a cursor handed out afterwards is always at or past it. Returns the
+    number of deleted changes.
+    """
+    with transaction.atomic():
+        horizon, _ = (
+            ChangeLogHorizon.objects.select_for_update().get_or_create(pk=1)
+        )
+        last = Change.objects.filter(
+            created_at__lt=before,
+        ).aggregate(last=Max('txid'))['last']
+        if last is None:
+            return 0
+
+        horizon.txid = max(horizon.txid, min(last + 1, current_horizon()))
+        horizon.save(update_fields=['txid'])
+        deleted, _ = Change.objects.filter(txid__lt=horizon.txid).delete()
+
+    return deleted
+
+
+def collapse_changes(changes):
+    """Return created, updated and deleted ids per model.
+
+    changes is an ordered iterable of (model, object_id, action); only the
+    first and the last action of each object matter.
+    """
+    first, last = {}, {}
+    for model, object_id, action in changes:
+        first.setdefault((model, object_id), action)
+        last[(model, object_id)] = action
+
+    result = {
+        model: {'created': set(), 'updated': set(), 'deleted': set()}
+        for model in SYNC_MODELS
+    }
+    for (model, object_id), action in last.items():
+        created = first[(model, object_id)] == 'INSERT'
+        if action == 'DELETE':
+            if not created:   # never seen by the client, nothing to report
+                result[model]['deleted'].add(object_id)
+        elif created:
+            result[model]['created'].add(object_id)
+        else:
+            result[model]['updated'].add(object_id)
+
+    return result
+
+
+def _serialize(model, objs, context):
+    serializer_class = SYNC_MODELS[model][2]
+    return serializer_class(objs, many=True, context=context).data
+
+
+def _load(model, user, ids=None):
+    """Return the user's objects of model, limited to ids if given."""
+    queryset = SYNC_MODELS[model][1].objects.filter(user=user)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    if model == 'recipe':
+        queryset = queryset.prefetch_related('tags', 'ingredients')
+
+    return list(queryset.order_by('id'))
+
+
+def build_sync(user, cursor, context):
+    """Return the sync payload for user since cursor (None for a full sync).
+
+    Raises ResyncRequired when the changes since cursor have been pruned.
+
+    The cost is one query for the change log and one per changed model
+    (plus the recipe prefetches), proportional to what changed.
+    """
+    horizon = current_horizon()
+    payload = {'cursor': horizon}
+
+    if cursor is None:   # first sync, everything is new to the client
+        for model, (key, *_) in SYNC_MODELS.items():
+            objs = _load(model, user)
+            payload[key] = {
+                'created': _serialize(model, objs, context),
+                'updated': [],
+                'deleted': [],
+            }
+        return payload
+
+    changes = Change.objects.filter(
+        user_id=user.id,
+        txid__gte=cursor,
+        txid__lt=horizon,
+    ).order_by('txid', 'id').values_list('model', 'object_id', 'action')
+    collapsed = collapse_changes(changes)
+    # checked after reading the log, a prune committing in between is seen
+    if cursor < pruned_horizon():
+        raise ResyncRequired()
+
+    for model, (key, *_) in SYNC_MODELS.items():
+        ids = collapsed[model]
+        changed_ids = ids['created'] | ids['updated']
+        objs = _load(model, user, changed_ids) if changed_ids else []
+        found = {obj.id for obj in objs}
+        data = _serialize(model, objs, context)
+        payload[key] = {
+            'created': [d for d in data if d['id'] in ids['created']],
+            'updated': [d for d in data if d['id'] in ids['updated']],
+            # deleted by a transaction past the horizon, reported early
+            'deleted': sorted(ids['deleted'] | (changed_ids - found)),
+        }
+
+    return payload
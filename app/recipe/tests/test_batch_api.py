@@ -0,0 +1,160 @@
+"""
+Tests for the recipe batch API.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+
+
+BATCH_URL = reverse('recipe:recipe-batch')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def create_op(title='New recipe', **data):
+    """Return a create operation."""
+    return {
+        'op': 'create',
+        'data': {'title': title, 'time_minutes': 10, 'price': '2.50', **data},
+    }
+
+
+class PrivateBatchApiTests(TestCase):
+    """Test authenticated batch requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_batch_create_update_delete(self):
+        """Test applying mixed operations in one request."""
+        updated = create_recipe(user=self.user, title='Old title')
+        deleted = create_recipe(user=self.user)
+        payload = {'operations': [
+            create_op(tags=[{'name': 'Quick'}]),
+            {'op': 'update', 'id': updated.id,
+             'data': {'title': 'New title', 'tags': [{'name': 'Quick'}]}},
+            {'op': 'delete', 'id': deleted.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['applied'])
+        self.assertEqual(
+            [r['status'] for r in res.data['results']], [201, 200, 204],
+        )
+        self.assertEqual(
+            res.data['results'][1]['data']['tags'][0]['name'], 'Quick',
+        )
+        updated.refresh_from_db()
+        self.assertEqual(updated.title, 'New title')
+        self.assertFalse(Recipe.objects.filter(id=deleted.id).exists())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_atomic_batch_rolled_back_on_error(self):
+        """Test an atomic batch applies nothing if one operation fails."""
+        recipe = create_recipe(user=self.user)
+        payload = {'operations': [
+            create_op(),
+            {'op': 'delete', 'id': recipe.id},
+            create_op(time_minutes='soon'),
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(res.data['applied'])
+        self.assertEqual(
+            [r['status'] for r in res.data['results']], [424, 424, 400],
+        )
+        self.assertIn('time_minutes', res.data['results'][2]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_best_effort_batch_applies_valid_operations(self):
+        """Test a best effort batch applies what it can."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        other_recipe = create_recipe(user=other_user)
+        payload = {'mode': 'best_effort', 'operations': [
+            create_op(),
+            create_op(price='not a price'),
+            {'op': 'delete', 'id': other_recipe.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['status'] for r in res.data['results']], [201, 400, 404],
+        )
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+        self.assertTrue(Recipe.objects.filter(id=other_recipe.id).exists())
+
+    def test_batch_same_recipe_twice_error(self):
+        """Test a recipe can only be targeted once per batch."""
+        recipe = create_recipe(user=self.user)
+        payload = {'mode': 'best_effort', 'operations': [
+            {'op': 'update', 'id': recipe.id, 'data': {'title': 'A'}},
+            {'op': 'delete', 'id': recipe.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(
+            [r['status'] for r in res.data['results']], [200, 400],
+        )
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_batch_deletes_in_one_query(self):
+        """Test deleting many recipes doesn't cost queries per recipe."""
+        recipes = [create_recipe(user=self.user) for i in range(10)]
+        payload = {'operations': [
+            {'op': 'delete', 'id': recipe.id} for recipe in recipes[:2]
+        ]}
+        self.client.post(BATCH_URL, payload, format='json')
+
+        payload = {'operations': [
+            {'op': 'delete', 'id': recipe.id} for recipe in recipes[2:]
+        ]}
+        # lookup and prefetches, savepoint pair, collect and three DELETEs
+        with self.assertNumQueries(9):
+            res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(len(res.data['results']), 8)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_invalid_batch_error(self):
+        """Test malformed batches return a 400."""
+        for payload in ({'operations': []},
+                        {'operations': [{'op': 'update'}]},
+                        {'operations': [{'op': 'rename', 'id': 1}]},
+                        {'mode': 'sometimes', 'operations': [create_op()]}):
+            res = self.client.post(BATCH_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
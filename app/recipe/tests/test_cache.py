@@ -0,0 +1,235 @@
+"""
+Tests for the per-user response cache.
+"""
+import threading
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+
+from recipe.cache import (
+    get_generation,
+    get_or_build,
+    normalize_params,
+)
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ResponseCacheApiTests(TestCase):
+    """Test list endpoints served from the response cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        """Test an unchanged list is returned without queries."""
+        create_recipe(user=self.user)
+        res1 = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_write_invalidates_cached_lists(self):
+        """Test writing a recipe or a tag bumps the user's generation."""
+        self.client.get(RECIPES_URL)
+        self.client.get(TAGS_URL)
+        generation = get_generation(self.user.id)
+
+        create_recipe(user=self.user, title='New recipe')
+        Tag.objects.create(user=self.user, name='New tag')
+
+        self.assertGreater(get_generation(self.user.id), generation)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data['results'][0]['title'], 'New recipe')
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.data['results'][0]['name'], 'New tag')
+
+    def test_cache_limited_to_user(self):
+        """Test users never see each other's cached lists."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(user=other)
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+        other_client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+
+class ETagApiTests(TestCase):
+    """Test conditional GETs on the recipe endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_not_modified(self):
+        """Test a matching If-None-Match returns 304 without queries."""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_detail_not_modified(self):
+        """Test conditional GETs on the recipe detail route."""
+        recipe = create_recipe(user=self.user)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_wildcard_requires_existing_resource(self):
+        """Test If-None-Match: * is a 304 only for a recipe that exists."""
+        recipe = create_recipe(user=self.user)
+        other = create_recipe(user=get_user_model().objects.create_user(
+            'other@example.com', 'password123',
+        ))
+
+        res = self.client.get(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            HTTP_IF_NONE_MATCH='*',
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        for recipe_id in (other.id, recipe.id + other.id):
+            res = self.client.get(
+                reverse('recipe:recipe-detail', args=[recipe_id]),
+                HTTP_IF_NONE_MATCH='*',
+            )
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_url_epoch_expires_responses(self):
+        """Test responses embedding expiring URLs follow the URL epoch."""
+        storage = Recipe._meta.get_field('image').storage
+        create_recipe(user=self.user)
+        with patch.object(storage, 'url_epoch', create=True, return_value=1):
+            etag = self.client.get(RECIPES_URL)['ETag']
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with patch.object(storage, 'url_epoch', create=True, return_value=2):
+            with self.assertNumQueries(3):   # rebuilt, not from the cache
+                res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_changes_on_write(self):
+        """Test a stale ETag gets the full, updated response."""
+        recipe = create_recipe(user=self.user)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(url, {'title': 'New title'})
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_etag_differs_per_query(self):
+        """Test a filtered list does not match the unfiltered ETag."""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(
+            TAGS_URL,
+            {'assigned_only': 1},
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class ResponseCacheTests(TestCase):
+    """Test the cache helpers."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_normalize_params(self):
+        """Test equivalent query strings share one key."""
+        params = ('tags', 'ingredients')
+        a = normalize_params(QueryDict('tags=2,1&ingredients=3'), params)
+        b = normalize_params(QueryDict('ingredients=3&tags=1,2,2'), params)
+        c = normalize_params(QueryDict('tags=1'), params)
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_get_or_build_waits_for_other_builder(self):
+        """Test a miss being rebuilt elsewhere is not rebuilt again."""
+        cache.add('key:lock', 1)   # another worker is building 'key'
+        timer = threading.Timer(0.1, cache.set, args=('key', 'built'))
+        timer.start()
+        build = Mock(return_value='rebuilt')
+
+        value = get_or_build('key', build)
+
+        timer.join()
+        self.assertEqual(value, 'built')
+        build.assert_not_called()
+
+    def test_get_or_build_builds_once(self):
+        """Test a miss is built once and then served from the cache."""
+        build = Mock(return_value='built')
+
+        get_or_build('key', build)
+        value = get_or_build('key', build)
+
+        self.assertEqual(value, 'built')
+        build.assert_called_once()
+        self.assertIsNone(cache.get('key:lock'))
@@ -0,0 +1,152 @@
+"""
+Tests for the recipe export.
+"""
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+from recipe.export import (
+    export_recipes,
+    gzip_stream,
+    iter_chunks,
+)
+from recipe.serializers import RecipeDetailSerializer
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def read_stream(res):
+    """Return the joined body of a streaming response."""
+    return b''.join(res.streaming_content)
+
+
+class ExportHelperTests(SimpleTestCase):
+    """Test the export helpers."""
+
+    def test_iter_chunks(self):
+        """Test rows are split into bounded chunks."""
+        self.assertEqual(
+            list(iter_chunks(range(5), 2)), [[0, 1], [2, 3], [4]],
+        )
+
+    def test_gzip_stream(self):
+        """Test parts are gzipped as one stream."""
+        parts = [b'first\n', b'', b'second\n']
+
+        data = b''.join(gzip_stream(parts))
+
+        self.assertEqual(gzip.decompress(data), b'first\nsecond\n')
+
+
+class PrivateExportApiTests(TestCase):
+    """Test the export endpoint."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_export_ndjson(self):
+        """Test each recipe is a JSON line matching the detail serializer."""
+        r1 = create_recipe(user=self.user, title='Curry')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        r1.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice'),
+        )
+        r2 = create_recipe(user=self.user, title='Toast')
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        create_recipe(user=other_user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = read_stream(res).decode().splitlines()
+        expected = [dict(RecipeDetailSerializer(r).data) for r in (r1, r2)]
+        for item in expected:
+            del item['image_variants']   # derived files, not exported
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_export_csv_gzipped(self):
+        """Test a CSV export is gzipped when the client accepts it."""
+        recipe = create_recipe(user=self.user, title='Curry, hot')
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Dinner'),
+            Tag.objects.create(user=self.user, name='Spicy'),
+        )
+
+        res = self.client.get(
+            EXPORT_URL, {'type': 'csv'}, HTTP_ACCEPT_ENCODING='gzip',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        rows = list(csv.DictReader(
+            io.StringIO(gzip.decompress(read_stream(res)).decode()),
+        ))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Curry, hot')
+        self.assertEqual(rows[0]['price'], '5.25')
+        self.assertEqual(rows[0]['tags'], 'Dinner;Spicy')
+
+    def test_export_respects_filters(self):
+        """Test the list filters apply to the export."""
+        create_recipe(user=self.user, time_minutes=10)
+        create_recipe(user=self.user, time_minutes=90)
+
+        res = self.client.get(EXPORT_URL, {'max_time': 30})
+
+        lines = read_stream(res).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+    def test_export_queries_per_chunk(self):
+        """Test the query count grows with chunks, not recipes."""
+        for i in range(5):
+            create_recipe(user=self.user)
+
+        # one fetch of the cursor per chunk plus one query per relation
+        with self.assertNumQueries(1 + 3 * 2):
+            data = b''.join(export_recipes(
+                Recipe.objects.filter(user=self.user), chunk_size=2,
+            ))
+
+        self.assertEqual(len(data.splitlines()), 5)
+
+    def test_export_invalid_type_error(self):
+        """Test an unknown export format returns a 400."""
+        res = self.client.get(EXPORT_URL, {'type': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,75 @@
+"""
+Tests for the fast path serializers.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+from recipe.fast_serializers import FastRecipeSerializer
+from recipe.serializers import RecipeSerializer
+
+
+class FastRecipeSerializerTests(TestCase):
+    """Test the fast path matches RecipeSerializer field for field."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    def assert_same_output(self, queryset):
+        queryset = queryset.order_by('-id')
+        fast = FastRecipeSerializer(
+            queryset.values(*FastRecipeSerializer.fields),
+        ).data
+        expected = RecipeSerializer(queryset, many=True).data
+
+        self.assertEqual(len(fast), len(expected))
+        for fast_item, item in zip(fast, expected):
+            self.assertEqual(list(fast_item), list(item))   # field order
+            self.assertEqual(fast_item, dict(item))
+
+    def test_matches_recipe_serializer(self):
+        """Test recipes with and without relations render identically."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        r1 = Recipe.objects.create(
+            user=self.user,
+            title='Fried rice',
+            time_minutes=15,
+            price=Decimal('4.5'),
+            link='https://example.com/rice',
+        )
+        r1.tags.add(vegan, dinner)
+        r1.ingredients.add(rice)
+        r2 = Recipe.objects.create(
+            user=self.user,
+            title='Water',
+            time_minutes=0,
+            price=Decimal('0.00'),
+        )
+        r2.tags.add(dinner)
+        Recipe.objects.create(
+            user=self.user,
+            title='Feast',
+            time_minutes=300,
+            price=Decimal('999.99'),
+        )
+
+        self.assert_same_output(Recipe.objects.filter(user=self.user))
+
+    def test_empty(self):
+        """Test an empty list needs no queries."""
+        with self.assertNumQueries(0):
+            data = FastRecipeSerializer([]).data
+
+        self.assertEqual(data, [])
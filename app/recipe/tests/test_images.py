@@ -0,0 +1,196 @@
+"""
+Tests for recipe image variants.
+"""
+import io
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.images import (
+    generate_variants,
+    render_variants,
+    variant_name,
+)
+from recipe.serializers import RecipeDetailSerializer
+
+
+def image_bytes(size, mode='RGB', fmt='JPEG'):
+    """Return an encoded image of size."""
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class RenderVariantsTests(SimpleTestCase):
+    """Test rendering variants."""
+
+    def test_render_sizes(self):
+        """Test each variant is scaled to its size on the long side."""
+        rendered = render_variants(
+            io.BytesIO(image_bytes((2000, 1000))), (128, 512), ['jpeg'], 80,
+        )
+
+        self.assertEqual(sorted(rendered), [128, 512])
+        with Image.open(io.BytesIO(rendered[128]['jpeg'])) as variant:
+            self.assertEqual(variant.format, 'JPEG')
+            self.assertEqual(variant.size, (128, 64))
+
+    def test_no_upscaling(self):
+        """Test sizes above the original are skipped."""
+        rendered = render_variants(
+            io.BytesIO(image_bytes((300, 200))), (128, 512), ['jpeg'], 80,
+        )
+
+        self.assertEqual(sorted(rendered), [128])
+
+    def test_transparent_image_as_jpeg(self):
+        """Test images with alpha are flattened for JPEG."""
+        data = image_bytes((400, 400), mode='RGBA', fmt='PNG')
+
+        rendered = render_variants(io.BytesIO(data), (128,), ['jpeg'], 80)
+
+        self.assertIn('jpeg', rendered[128])
+
+    def test_variant_name(self):
+        """Test variants are stored next to the original."""
+        self.assertEqual(
+            variant_name('uploads/recipe/abc.png', 128, 'webp'),
+            'uploads/recipe/abc/128.webp',
+        )
+
+
+@override_settings(IMAGE_VARIANTS={'ASYNC': False, 'FORMATS': ['jpeg']})
+class ImageVariantsApiTests(TestCase):
+    """Test variants of uploaded images."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        self.upload_url = reverse(
+            'recipe:recipe-upload-image', args=[self.recipe.id],
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, size=(1200, 800)):
+        upload = SimpleUploadedFile('photo.jpg', image_bytes(size))
+        return self.client.post(
+            self.upload_url, {'image': upload}, format='multipart',
+        )
+
+    def test_variants_generated_after_commit(self):
+        """Test the upload returns before variants exist, then lists them."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_variants'], {})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+        for callback in callbacks:
+            callback()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(sorted(self.recipe.image_variants, key=int),
+                         ['128', '512', '1024'])
+        name = self.recipe.image_variants['128']['jpeg']
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        res = self.client.get(
+            reverse('recipe:recipe-detail', args=[self.recipe.id]),
+        )
+        self.assertTrue(
+            res.data['image_variants']['128']['jpeg'].startswith('http://'),
+        )
+        res = self.client.get(reverse('recipe:recipe-list'))
+        self.assertEqual(
+            res.data['results'][0]['image_variants']['512']['jpeg'],
+            f'http://testserver/static/media/'
+            f'{self.recipe.image_variants["512"]["jpeg"]}',
+        )
+
+    def test_stale_update_keeps_variants(self):
+        """Test a recipe update read before the variants doesn't drop them."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.upload()
+        stale = Recipe.objects.get(id=self.recipe.id)   # read by a PATCH
+        for callback in callbacks:
+            callback()
+
+        serializer = RecipeDetailSerializer(
+            stale, data={'title': 'Dal'}, partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Dal')
+        self.assertIn('128', self.recipe.image_variants)
+
+    def test_new_upload_resets_variants(self):
+        """Test replacing an image drops the variants of the old one."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload()
+        self.recipe.refresh_from_db()
+        self.assertIn('128', self.recipe.image_variants)
+        res = self.upload()
+
+        self.assertEqual(res.data['image_variants'], {})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_replaced_image_variants_discarded(self):
+        """Test variants of an image replaced while rendering are dropped."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(size=(100, 100))   # stored, nothing to render
+
+        def render_replaced(*args):
+            # another upload lands while this one is being rendered
+            Recipe.objects.filter(id=self.recipe.id).update(image='new.jpg')
+            return render_variants(*args)
+
+        with patch('recipe.images.render_variants', render_replaced):
+            Recipe.objects.filter(id=self.recipe.id).update(image_variants={})
+            with override_settings(IMAGE_VARIANTS={'SIZES': (16,),
+                                                   'FORMATS': ['jpeg']}):
+                generate_variants(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_small_image_has_no_variants(self):
+        """Test images smaller than every size keep only the original."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(size=(100, 100))
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
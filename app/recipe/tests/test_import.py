@@ -0,0 +1,287 @@
+"""
+Tests for the bulk recipe import.
+"""
+import gzip
+import io
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+    RecipeImport,
+)
+
+from recipe import importer
+from recipe.export import export_recipes
+from recipe.importer import import_recipes
+
+
+IMPORT_URL = reverse('recipe:recipe-bulk-import')
+
+
+def ndjson(*records):
+    """Return records as an NDJSON byte stream."""
+    return io.BytesIO(
+        ''.join(json.dumps(record) + '\n' for record in records).encode(),
+    )
+
+
+def sample_record(**params):
+    """Return a sample import record."""
+    record = {
+        'title': 'Curry',
+        'time_minutes': 30,
+        'price': '7.50',
+        'tags': [{'name': 'Dinner'}],
+        'ingredients': [{'name': 'Rice'}, {'name': 'Lentils'}],
+    }
+    record.update(params)
+    return record
+
+
+class ImportRecipesTests(TestCase):
+    """Test the importer."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def test_import_recipes_with_relations(self):
+        """Test recipes are loaded with their tags and ingredients."""
+        state, errors = import_recipes(self.user, ndjson(
+            sample_record(),
+            sample_record(title='Dal', tags=['Dinner', 'Vegan'],
+                          description='Spiced lentils'),
+        ))
+
+        self.assertEqual(errors, [])
+        self.assertTrue(state.finished)
+        self.assertEqual(state.imported, 2)
+        dal = Recipe.objects.get(user=self.user, title='Dal')
+        self.assertEqual(dal.price, Decimal('7.50'))
+        self.assertEqual(dal.description, 'Spiced lentils')
+        self.assertEqual(
+            sorted(dal.tags.values_list('name', flat=True)),
+            ['Dinner', 'Vegan'],
+        )
+        self.assertEqual(dal.ingredients.count(), 2)
+        # the vector computed by the import matches the trigger's own
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT search_vector = core_recipe_document('
+                'id, title, description) FROM core_recipe WHERE id = %s',
+                [dal.id],
+            )
+            self.assertTrue(cursor.fetchone()[0])
+        self.assertTrue(
+            Recipe.objects.filter(id=dal.id, search_vector='lentil').exists()
+        )
+
+    def test_import_deduplicates_tags_per_user(self):
+        """Test imported names reuse the user's existing tags."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        Tag.objects.create(user=other_user, name='Vegan')
+
+        import_recipes(self.user, ndjson(
+            sample_record(tags=['Dinner', 'Vegan', 'Dinner']),
+            sample_record(tags=['Vegan']),
+        ))
+
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(tag.recipe_set.count(), 1)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2,
+        )
+
+    def test_invalid_records_rejected(self):
+        """Test invalid records are reported and skipped."""
+        stream = io.BytesIO(b'\n'.join([
+            json.dumps(sample_record()).encode(),
+            b'{not json',
+            json.dumps(sample_record(title='')).encode(),
+            json.dumps(sample_record(price='1.234')).encode(),
+            json.dumps(sample_record(time_minutes='soon')).encode(),
+            json.dumps(sample_record(time_minutes=99999999999)).encode(),
+            json.dumps(sample_record(title='Cur\x00ry')).encode(),
+            json.dumps(sample_record(description='\x00')).encode(),
+            json.dumps(sample_record(tags=['Din\x00ner'])).encode(),
+        ]))
+
+        state, errors = import_recipes(self.user, stream)
+
+        self.assertEqual((state.imported, state.rejected), (1, 8))
+        self.assertEqual([e['record'] for e in errors],
+                         [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertIn('time_minutes', errors[4]['error'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_queries_per_batch(self):
+        """Test the query count grows with batches, not records."""
+        records = [sample_record(title=f'Recipe {i}') for i in range(50)]
+
+        with CaptureQueriesContext(connection) as queries:
+            import_recipes(self.user, ndjson(*records), batch_size=25)
+        with CaptureQueriesContext(connection) as more_queries:
+            import_recipes(
+                self.user, ndjson(*records * 2), batch_size=25, key='more',
+            )
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 150)
+        per_batch = (len(more_queries) - len(queries)) / 2
+        self.assertLessEqual(per_batch, 12)
+
+    def test_resume_after_failure(self):
+        """Test rerunning an interrupted import loads every record once."""
+        records = [sample_record(title=f'Recipe {i}') for i in range(5)]
+        merge_batch = importer.merge_batch
+        calls = []
+
+        def failing_merge(*args):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            merge_batch(*args)
+
+        with patch('recipe.importer.merge_batch', side_effect=failing_merge):
+            with self.assertRaises(RuntimeError):
+                import_recipes(self.user, ndjson(*records),
+                               key='k', batch_size=2)
+
+        state = RecipeImport.objects.get(user=self.user, key='k')
+        self.assertEqual((state.position, state.finished), (2, False))
+
+        state, _ = import_recipes(self.user, ndjson(*records),
+                                  key='k', batch_size=2)
+
+        self.assertTrue(state.finished)
+        self.assertEqual(state.imported, 5)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            [f'Recipe {i}' for i in range(5)],
+        )
+
+    def test_finished_import_not_repeated(self):
+        """Test importing again with a finished key loads nothing."""
+        import_recipes(self.user, ndjson(sample_record()), key='k')
+        import_recipes(self.user, ndjson(sample_record()), key='k')
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_export_round_trip(self):
+        """Test an export imports back as the same recipes."""
+        import_recipes(self.user, ndjson(
+            sample_record(),
+            sample_record(title='Dal', tags=['Sweet; sour', 'A\\B;']),
+        ))
+        for fmt in ['ndjson', 'csv']:
+            data = b''.join(export_recipes(
+                Recipe.objects.filter(user=self.user),
+                fmt=fmt,
+                compress=True,
+            ))
+            other_user = get_user_model().objects.create_user(
+                f'{fmt}@example.com',
+                'password123',
+            )
+
+            state, errors = import_recipes(
+                other_user, io.BytesIO(data), fmt=fmt,
+            )
+
+            self.assertEqual((state.imported, errors), (2, []))
+            curry = Recipe.objects.get(user=other_user, title='Curry')
+            self.assertEqual(
+                sorted(curry.ingredients.values_list('name', flat=True)),
+                ['Lentils', 'Rice'],
+            )
+            dal = Recipe.objects.get(user=other_user, title='Dal')
+            self.assertEqual(
+                sorted(dal.tags.values_list('name', flat=True)),
+                ['A\\B;', 'Sweet; sour'],
+            )
+
+
+class PrivateImportApiTests(TestCase):
+    """Test the import endpoint."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_import_upload(self):
+        """Test importing an uploaded gzipped CSV file."""
+        data = gzip.compress(
+            b'title,time_minutes,price,tags\n'
+            b'Curry,30,7.50,Dinner;Spicy\n'
+            b'Toast,5,1.00,\n'
+        )
+        upload = SimpleUploadedFile('recipes.csv.gz', data)
+
+        res = self.client.post(
+            IMPORT_URL,
+            {'file': upload, 'type': 'csv', 'key': 'first'},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 2)
+        self.assertTrue(res.data['finished'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+        res = self.client.get(IMPORT_URL, {'key': 'first'})
+
+        self.assertEqual(res.data['imported'], 2)
+        self.assertEqual(res.data['errors'], [])
+
+    def test_import_invalidates_cached_list(self):
+        """Test imported recipes show up in a cached recipe list."""
+        self.client.get(reverse('recipe:recipe-list'))
+        upload = SimpleUploadedFile(
+            'recipes.ndjson', ndjson(sample_record()).getvalue(),
+        )
+
+        self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_import_without_file_error(self):
+        """Test posting no file returns a 400."""
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_status_other_user_not_found(self):
+        """Test users can't see each other's imports."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        RecipeImport.objects.create(user=other_user, key='theirs')
+
+        res = self.client.get(IMPORT_URL, {'key': 'theirs'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -61,7 +61,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)  # res.content is json and res.data is a list of dict
+        self.assertEqual(res.data['results'], serializer.data)  # results is a list of dict
 
     def test_ingredients_limited_to_user(self):
         """Test list of ingredients is limited to authenticated user."""
@@ -72,9 +72,9 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
 
     def test_update_ingredient(self):
@@ -118,8 +118,8 @@ class PrivateIngredientsApiTests(TestCase):
 
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """Test filtered ingredients returns a unique list."""
@@ -142,4 +142,51 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']), 1)
+    def test_search_ingredients(self):
+        """Test prefix and typo tolerant ingredient lookups."""
+        Ingredient.objects.create(user=self.user, name='Chicken')
+        Ingredient.objects.create(user=self.user, name='Chickpeas')
+        Ingredient.objects.create(user=self.user, name='Rice')
+        other_user = create_user(email='user2@example.com')
+        Ingredient.objects.create(user=other_user, name='Chicken wings')
+
+        res = self.client.get(INGREDIENTS_URL, {'search': 'chick'})
+        names = {i['name'] for i in res.data['results']}
+        self.assertEqual(names, {'Chicken', 'Chickpeas'})
+
+        res = self.client.get(INGREDIENTS_URL, {'search': 'chiken'})
+        self.assertEqual(res.data['results'][0]['name'], 'Chicken')
+
+    def test_search_ingredients_top_k(self):
+        """Test page_size limits the matches to the best k."""
+        for name in ['Salt', 'Salted butter', 'Salsa', 'Sea salt']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(
+            INGREDIENTS_URL,
+            {'search': 'salt', 'page_size': 2},
+        )
+
+        names = [i['name'] for i in res.data['results']]
+        self.assertEqual(names[0], 'Salt')   # exact prefix match first
+        self.assertEqual(len(names), 2)
+
+    def test_ingredients_with_counts(self):
+        """Test listing ingredients with the number of recipes using each."""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Pepper')
+        recipe = Recipe.objects.create(
+            title='Chips',
+            time_minutes=20,
+            price=Decimal('3.00'),
+            user=self.user,
+        )
+        recipe.ingredients.add(salt)
+
+        res = self.client.get(INGREDIENTS_URL, {'with_counts': 1})
+
+        self.assertEqual(
+            [(i['name'], i['recipe_count']) for i in res.data['results']],
+            [('Salt', 1), ('Pepper', 0)],
+        )
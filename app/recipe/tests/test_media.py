@@ -0,0 +1,199 @@
+"""
+Tests for serving recipe images.
+"""
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.media import parse_range
+
+
+IMAGE = 'uploads/recipe/ab/cd/abcd.jpg'
+VARIANT = 'uploads/recipe/ab/cd/abcd/128.jpg'
+
+
+def media_url(name):
+    """Return the URL of a media file."""
+    return reverse('media', args=[name])
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Test parsing Range headers."""
+
+    def test_ranges(self):
+        """Test single ranges are parsed and clamped to the file."""
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+
+    def test_ignored(self):
+        """Test missing, malformed and multiple ranges are ignored."""
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range('bytes=-', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+
+    def test_unsatisfiable(self):
+        """Test ranges past the end raise ValueError."""
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=5-1', 100)
+
+
+class MediaViewTests(TestCase):
+    """Test the media view."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        for name in (IMAGE, VARIANT):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as media_file:
+                media_file.write(bytes(range(100)))
+        self.mtime = os.stat(os.path.join(self.media_root, IMAGE)).st_mtime
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+            image=IMAGE,
+            image_variants={'128': {'jpeg': VARIANT}},
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_serve_file(self):
+        """Test the owner gets the file with long lived cache headers."""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), bytes(range(100)))
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], '100')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+        self.assertEqual(res['Last-Modified'], http_date(self.mtime))
+
+    def test_serve_variant(self):
+        """Test variants listed by an owned recipe are served."""
+        res = self.client.get(media_url(VARIANT))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_range(self):
+        """Test a byte range is served as partial content."""
+        res = self.client.get(media_url(IMAGE), HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(res['Content-Length'], '10')
+        self.assertEqual(res['Content-Range'], 'bytes 10-19/100')
+
+    def test_range_not_satisfiable(self):
+        """Test a range past the end gets a 416."""
+        res = self.client.get(media_url(IMAGE), HTTP_RANGE='bytes=200-')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], 'bytes */100')
+
+    def test_if_range_changed(self):
+        """Test a stale If-Range gets the whole file."""
+        res = self.client.get(
+            media_url(IMAGE),
+            HTTP_RANGE='bytes=10-19',
+            HTTP_IF_RANGE=http_date(self.mtime - 3600),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_not_modified(self):
+        """Test If-Modified-Since gets a 304 without the file."""
+        res = self.client.get(
+            media_url(IMAGE), HTTP_IF_MODIFIED_SINCE=http_date(self.mtime),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_other_users_file_not_found(self):
+        """Test files of other users' recipes look missing."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unreferenced_and_missing_not_found(self):
+        """Test unreferenced, missing and outside files aren't served."""
+        for name in ('uploads/recipe/ab/cd/missing.jpg', '../secret'):
+            res = self.client.get(media_url(name))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_auth_required(self):
+        """Test anonymous requests are refused."""
+        res = APIClient().get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(MEDIA_SERVING={'OFFLOAD': 'x-accel-redirect'})
+    def test_x_accel_redirect(self):
+        """Test nginx is handed the internal location of the file."""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected-media/{IMAGE}')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_SERVING={'OFFLOAD': 'x-sendfile'})
+    def test_x_sendfile(self):
+        """Test Apache is handed the path of the file."""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res['X-Sendfile'],
+                         os.path.join(self.media_root, IMAGE))
+
+    def test_remote_storage_redirect(self):
+        """Test files of a storage without paths redirect to their URL."""
+        storage = Recipe._meta.get_field('image').storage
+        url = 'https://bucket.example.com/image.jpg?X-Amz-Signature=abc'
+        with patch.object(storage, 'path', side_effect=NotImplementedError), \
+                patch.object(storage, 'url', return_value=url):
+            res = self.client.get(media_url(IMAGE))
+            other = self.client.get(media_url('uploads/recipe/other.jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(res['Location'], url)
+        self.assertIn('no-cache', res['Cache-Control'])
+        self.assertEqual(other.status_code, status.HTTP_404_NOT_FOUND)
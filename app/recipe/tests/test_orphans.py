@@ -0,0 +1,163 @@
+"""
+Tests for collecting orphaned image files.
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from core.models import ImageBlob, Recipe
+
+from recipe.orphans import (
+    collect_orphans,
+    find_orphans,
+    iter_files,
+    referenced_names,
+)
+
+
+OLD = 1_000_000_000   # mtime in 2001
+
+
+class MediaDirMixin:
+    """Temporary media root with helpers to create files in it."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        super().tearDown()
+
+    def make_file(self, name, old=True):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(b'x' * 10)
+        if old:
+            os.utime(path, (OLD, OLD))
+        return path
+
+
+class FindOrphansTests(MediaDirMixin, SimpleTestCase):
+    """Test finding orphans."""
+
+    def test_files_in_string_order(self):
+        """Test the walk yields names in the order the database sorts."""
+        names = [
+            'uploads/recipe/ab/c.jpg',
+            'uploads/recipe/ab.jpg',
+            'uploads/recipe/a-b.jpg',
+            'uploads/recipe/B.jpg',
+        ]
+        for name in names:
+            self.make_file(name)
+
+        walked = [name for name, _ in iter_files(self.root)]
+
+        self.assertEqual(walked, sorted(names))
+
+    def test_find_orphans(self):
+        """Test unreferenced files past the grace period are found."""
+        self.make_file('uploads/recipe/a.jpg')
+        self.make_file('uploads/recipe/b.jpg')
+        self.make_file('uploads/recipe/b/128.jpg')
+        self.make_file('uploads/recipe/c.jpg', old=False)
+        self.make_file('other/d.jpg')
+
+        orphans = find_orphans(
+            self.root,
+            names=['uploads/recipe/a.jpg', 'uploads/recipe/b/128.jpg',
+                   'uploads/recipe/missing.jpg'],
+        )
+
+        self.assertEqual([name for name, _, _ in orphans],
+                         ['uploads/recipe/b.jpg'])
+
+    def test_missing_directory(self):
+        """Test nothing is found when nothing was uploaded yet."""
+        self.assertEqual(list(find_orphans(self.root, names=[])), [])
+
+
+class CollectOrphansTests(MediaDirMixin, TestCase):
+    """Test collecting orphans against the database."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def create_recipe(self, **params):
+        return Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+            **params,
+        )
+
+    def test_referenced_names(self):
+        """Test images and variants are referenced, sorted and unique."""
+        self.create_recipe(
+            image='uploads/recipe/b.jpg',
+            image_variants={'128': {'jpeg': 'uploads/recipe/b/128.jpg'}},
+        )
+        self.create_recipe(image='uploads/recipe/b.jpg')
+        self.create_recipe(image='uploads/recipe/a.jpg')
+        self.create_recipe(image='elsewhere/c.jpg')
+
+        self.assertEqual(list(referenced_names()), [
+            'uploads/recipe/a.jpg',
+            'uploads/recipe/b.jpg',
+            'uploads/recipe/b/128.jpg',
+        ])
+
+    def test_collect(self):
+        """Test orphans are deleted along with their blob rows."""
+        kept = self.make_file('uploads/recipe/a.jpg')
+        orphan = self.make_file('uploads/recipe/b.jpg')
+        self.create_recipe(image='uploads/recipe/a.jpg')
+        recipe = self.create_recipe(image='uploads/recipe/b.jpg')
+        recipe.delete()
+
+        files, size = collect_orphans(find_orphans(self.root))
+
+        self.assertEqual((files, size), (1, 10))
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(
+            ImageBlob.objects.filter(name='uploads/recipe/b.jpg').exists(),
+        )
+
+    def test_dry_run(self):
+        """Test a dry run reports orphans without deleting them."""
+        orphan = self.make_file('uploads/recipe/b.jpg')
+        reported = []
+
+        files, _ = collect_orphans(
+            find_orphans(self.root),
+            dry_run=True,
+            report=lambda name, size: reported.append(name),
+        )
+
+        self.assertEqual(files, 1)
+        self.assertEqual(reported, ['uploads/recipe/b.jpg'])
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_touched_since_walk_kept(self):
+        """Test a file reused after it was found is not deleted."""
+        orphan = self.make_file('uploads/recipe/b.jpg')
+        orphans = list(find_orphans(self.root))
+        os.utime(orphan)   # e.g. a duplicate upload reusing it
+
+        files, _ = collect_orphans(orphans, grace=timedelta(hours=1))
+
+        self.assertEqual(files, 0)
+        self.assertTrue(os.path.exists(orphan))
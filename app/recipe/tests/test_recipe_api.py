@@ -9,7 +9,9 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -27,6 +29,7 @@ from recipe.serializers import (
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')  # return recipes/
+FACETS_URL = reverse('recipe:recipe-facets')
 
 
 def detail_url(recipe_id):
@@ -95,7 +98,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')  # latest item has highest no.
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 
     def test_recipe_list_limited_to_user(self):
@@ -109,7 +112,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 
     def test_get_recipe_detail(self):
@@ -262,6 +265,47 @@ class PrivateRecipeApiTests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test the same tag name twice in a payload creates one tag."""
+        payload = {
+            'title': 'Green Curry',
+            'time_minutes': 30,
+            'price': Decimal('6.50'),
+            'tags': [{'name': 'Thai'}, {'name': 'Thai'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+
+    def test_create_recipe_query_budget(self):
+        """Test creating a recipe costs the same however many items."""
+        Ingredient.objects.create(user=self.user, name='Ingredient 0')
+        payload = {
+            'title': 'Big Stew',
+            'time_minutes': 90,
+            'price': Decimal('12.00'),
+            'tags': [{'name': f'Tag {i}'} for i in range(10)],
+            'ingredients': [{'name': f'Ingredient {i}'} for i in range(30)],
+        }
+
+        # savepoint, insert recipe, then per relation: lookup, insert
+        # missing, fetch inserted, insert through rows; release savepoint,
+        # then render tags and ingredients
+        with self.assertNumQueries(13):
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 10)
+        self.assertEqual(recipe.ingredients.count(), 30)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(),
+            30,
+        )
+
     def test_create_tag_on_update(self):   # dont need to refreh from db
         """Test create tag when updating a recipe."""
         recipe = create_recipe(user=self.user)
@@ -289,6 +333,60 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all())
 
+    def test_update_unchanged_tags_writes_nothing(self):
+        """Test a PATCH with the same tags leaves the through rows alone."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Lunch'),
+            Tag.objects.create(user=self.user, name='Quick'),
+        )
+
+        payload = {'tags': [{'name': 'Quick'}, {'name': 'Lunch'}]}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                payload,
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        through_writes = [
+            q['sql'] for q in ctx.captured_queries
+            if 'core_recipe_tags' in q['sql']
+            and q['sql'].startswith(('DELETE', 'INSERT'))
+        ]
+        self.assertEqual(through_writes, [])
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_update_tags_writes_only_the_difference(self):
+        """Test changing tags issues one delete and one insert."""
+        keep = Tag.objects.create(user=self.user, name='Keep')
+        drop1 = Tag.objects.create(user=self.user, name='Drop 1')
+        drop2 = Tag.objects.create(user=self.user, name='Drop 2')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(keep, drop1, drop2)
+
+        payload = {'tags': [{'name': 'Keep'}, {'name': 'New 1'},
+                            {'name': 'New 2'}]}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                payload,
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        through_sql = [
+            q['sql'] for q in ctx.captured_queries
+            if 'core_recipe_tags' in q['sql']
+            and q['sql'].startswith(('DELETE', 'INSERT'))
+        ]
+        self.assertEqual(len(through_sql), 2)
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Keep', 'New 1', 'New 2'},
+        )
+
     def test_clear_recipe_tags(self):
         """Test clearing a recipes tags."""
         tag = Tag.objects.create(user=self.user, name='Dessert')
@@ -405,9 +503,9 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)   # s1.data is a dict, res.data is a list of dict
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])   # s1.data is a dict, results is a list of dict
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -425,9 +523,378 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_ids_no_duplicates(self):
+        """Test a recipe matching several filter ids is listed once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        recipe.tags.add(tag1, tag2)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'},
+            )
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in queries))
+
+    def test_filter_malformed_ids_error(self):
+        """Test malformed filter ids return a 400, not a 500."""
+        for params in ({'tags': '1,abc'}, {'ingredients': '2;3'},
+                       {'tags': ','}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[0], res.data)
+
+    def test_filter_expression(self):
+        """Test filtering with AND, OR and NOT over tags and ingredients."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        peanuts = Ingredient.objects.create(user=self.user, name='Peanuts')
+        curry = create_recipe(user=self.user, title='Curry')
+        curry.tags.add(vegan, dinner)
+        satay = create_recipe(user=self.user, title='Satay')
+        satay.tags.add(vegan, dinner)
+        satay.ingredients.add(peanuts)
+        salad = create_recipe(user=self.user, title='Salad')
+        salad.tags.add(vegan)
+
+        cases = {
+            'tag:vegan AND tag:dinner AND NOT ingredient:peanuts': [curry],
+            'tag:Vegan tag:dinner': [satay, curry],   # AND is implied
+            'tag:dinner OR ingredient:peanuts': [satay, curry],
+            'tag:vegan -tag:dinner': [salad],
+            '(tag:dinner OR tag:vegan) AND NOT (ingredient:peanuts)':
+                [salad, curry],
+            'tag:unknown': [],
+            'NOT tag:unknown': [salad, satay, curry],
+        }
+        for expression, expected in cases.items():
+            res = self.client.get(RECIPES_URL, {'q': expression})
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [r['id'] for r in res.data['results']],
+                [r.id for r in expected],
+                expression,
+            )
+
+    def test_filter_expression_quoted_names(self):
+        """Test names with spaces can be quoted."""
+        butter = Ingredient.objects.create(
+            user=self.user, name='Peanut Butter',
+        )
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(butter)
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'q': 'ingredient:"peanut butter"'})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_filter_expression_limited_to_user(self):
+        """Test names resolve to the user's own tags only."""
+        other_user = create_user(email='other@example.com', password='test123')
+        other_tag = Tag.objects.create(user=other_user, name='Vegan')
+        other_recipe = create_recipe(user=other_user)
+        other_recipe.tags.add(other_tag)
+
+        res = self.client.get(RECIPES_URL, {'q': 'tag:vegan'})
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_filter_expression_invalid(self):
+        """Test an invalid expression returns a 400."""
+        for expression in ('tag:vegan AND', '(tag:vegan', 'tag:vegan)',
+                           'vegan', 'colour:red', 'tag:"vegan', 'OR',
+                           ' tag:vegan' * 51, 'NOT ' * 5000 + 'tag:a',
+                           '(' * 3000 + 'tag:a', '-' * 5000 + 'tag:a'):
+            res = self.client.get(RECIPES_URL, {'q': expression})
+
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, expression,
+            )
+            self.assertIn('q', res.data)
+
+    def test_filter_by_time_and_price_ranges(self):
+        """Test min/max range filters on time_minutes and price."""
+        quick = create_recipe(
+            user=self.user, time_minutes=10, price=Decimal('3'),
+        )
+        create_recipe(user=self.user, time_minutes=45, price=Decimal('4'))
+        create_recipe(user=self.user, time_minutes=20, price=Decimal('9.50'))
+
+        params = {'max_time': 30, 'max_price': '5.00'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data['results']], [quick.id])
+
+    def test_sort_by_price_paginated(self):
+        """Test sorting by price pages through every recipe once."""
+        for price in ['7.00', '2.00', '7.00', '5.00', '1.00']:
+            create_recipe(user=self.user, price=Decimal(price))
+
+        params = {'ordering': 'price', 'page_size': 2, 'max_time': 30}
+        res = self.client.get(RECIPES_URL, params)
+        prices = [r['price'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            prices += [r['price'] for r in res.data['results']]
+
+        self.assertEqual(prices, ['1.00', '2.00', '5.00', '7.00', '7.00'])
+
+    def test_sort_by_time_descending(self):
+        """Test sorting by time_minutes, longest first."""
+        for minutes in [5, 60, 30]:
+            create_recipe(user=self.user, time_minutes=minutes)
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-time_minutes'})
+
+        self.assertEqual(
+            [r['time_minutes'] for r in res.data['results']], [60, 30, 5],
+        )
+
+    def test_unsupported_sort_or_range_error(self):
+        """Test sorts without an index and bad ranges return a 400."""
+        for params in ({'ordering': 'title'}, {'min_time': 'soon'},
+                       {'max_price': '1.234'}, {'min_time': '-1'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[0], res.data)
+
+    def test_facets(self):
+        """Test facet counts of the filtered recipes."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        r1 = create_recipe(user=self.user, time_minutes=10, price=Decimal('4'))
+        r1.tags.add(vegan, dinner)
+        r1.ingredients.add(rice)
+        r2 = create_recipe(
+            user=self.user, time_minutes=40, price=Decimal('12'),
+        )
+        r2.tags.add(vegan)
+        create_recipe(user=self.user, time_minutes=90, price=Decimal('25'))
+        other_user = create_user(email='other@example.com', password='test123')
+        create_recipe(user=other_user, time_minutes=10)
+
+        with self.assertNumQueries(4):   # q names, buckets, tags, ingredients
+            res = self.client.get(FACETS_URL, {'q': 'tag:vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 2)
+        self.assertEqual(res.data['tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'count': 2},
+            {'id': dinner.id, 'name': 'Dinner', 'count': 1},
+        ])
+        self.assertEqual(res.data['ingredients'], [
+            {'id': rice.id, 'name': 'Rice', 'count': 1},
+        ])
+        self.assertEqual(
+            [b['count'] for b in res.data['time_minutes']], [1, 0, 1, 0],
+        )
+        self.assertEqual(res.data['price'][0], {
+            'min': None, 'max': '5.00', 'count': 1,
+        })
+        self.assertEqual(
+            [b['count'] for b in res.data['price']], [1, 0, 1, 0],
+        )
+
+    def test_facets_cached_until_write(self):
+        """Test facets are served from cache until the user writes."""
+        create_recipe(user=self.user)
+        self.client.get(FACETS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(FACETS_URL)
+        self.assertEqual(res.data['count'], 1)
+
+        create_recipe(user=self.user)
+        res = self.client.get(FACETS_URL)
+        self.assertEqual(res.data['count'], 2)
+
+    def test_search_recipes(self):
+        """Test full-text search over title, tags and ingredients."""
+        r1 = create_recipe(user=self.user, title='Chicken Curry')
+        r2 = create_recipe(user=self.user, title='Weeknight Dinner')
+        r2.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Chicken'),
+        )
+        r2.tags.add(Tag.objects.create(user=self.user, name='Curry'))
+        create_recipe(user=self.user, title='Beef Stew')
+        create_recipe(
+            user=create_user(email='other@example.com', password='test123'),
+            title='Chicken Curry',
+        )
+
+        res = self.client.get(RECIPES_URL, {'search': 'chicken curry'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [r1.id, r2.id])   # title outranks the rest
+
+    def test_search_index_follows_writes(self):
+        """Test renaming an ingredient updates the recipes using it."""
+        recipe = create_recipe(user=self.user, title='Soup')
+        ingredient = Ingredient.objects.create(user=self.user, name='Leek')
+        recipe.ingredients.add(ingredient)
+
+        ingredient.name = 'Pumpkin'
+        ingredient.save()
+        res = self.client.get(RECIPES_URL, {'search': 'pumpkin'})
+        self.assertEqual(len(res.data['results']), 1)
+
+        recipe.ingredients.clear()
+        res = self.client.get(RECIPES_URL, {'search': 'pumpkin'})
+        self.assertEqual(len(res.data['results']), 0)
+
+    def test_search_results_paginated(self):
+        """Test ranked results are paged without repeats."""
+        for i in range(5):
+            create_recipe(
+                user=self.user,
+                title='Pasta ' * (i + 1),   # different ranks
+                description='pasta',
+            )
+
+        res = self.client.get(RECIPES_URL, {'search': 'pasta', 'page_size': 2})
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [r['id'] for r in res.data['results']]
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_search_ties_paged_by_id(self):
+        """Test results of equal rank are paged by id without OFFSET."""
+        recipes = [create_recipe(user=self.user, title='Pasta')
+                   for _ in range(5)]
+        create_recipe(user=self.user, title='Pasta Pasta Pasta')
+
+        ids, _ = self.walk_pages({'search': 'pasta', 'page_size': 2})
+
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(ids[1:], [r.id for r in reversed(recipes)])
+
+    def test_list_recipes_query_budget(self):
+        """Test listing recipes costs a fixed number of queries."""
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}'),
+                Tag.objects.create(user=self.user, name=f'Other tag {i}'),
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}'),
+            )
+
+        # recipes + tags + ingredients, whatever the number of recipes
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 5)
+        self.assertEqual(len(res.data['results'][0]['tags']), 2)
+
+    def test_retrieve_recipe_query_budget(self):
+        """Test retrieving a recipe costs a fixed number of queries."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice'),
+            Ingredient.objects.create(user=self.user, name='Beans'),
+        )
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['ingredients']), 2)
+
+
+    def test_recipes_paginated_by_cursor(self):
+        """Test walking recipe pages with cursors and no OFFSET."""
+        recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        ids = [r['id'] for r in res.data['results']]
+        # a recipe created while paging must not shift the later pages
+        create_recipe(user=self.user, title='Inserted while paging')
+        next_url = res.data['next']
+        while next_url:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(next_url)
+            self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+            ids += [r['id'] for r in res.data['results']]
+            next_url = res.data['next']
+
+        self.assertEqual(ids, [r.id for r in reversed(recipes)])
+
+    def walk_pages(self, params):
+        """Return the ids of every page, asserting no page used OFFSET."""
+        res = self.client.get(RECIPES_URL, params)
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(res.data['next'])
+            self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+            ids += [r['id'] for r in res.data['results']]
+        return ids, res
+
+    def test_sort_ties_paged_by_id(self):
+        """Test recipes sharing a sort value are paged by (value, id)."""
+        fast = [create_recipe(user=self.user, time_minutes=10)
+                for _ in range(5)]
+        slow = [create_recipe(user=self.user, time_minutes=30)
+                for _ in range(5)]
+
+        ids, res = self.walk_pages({'ordering': '-time_minutes',
+                                    'page_size': 2})
+
+        expected = [r.id for r in reversed(slow)] + \
+            [r.id for r in reversed(fast)]
+        self.assertEqual(ids, expected)
+        # and back again through the previous links
+        back = [r['id'] for r in res.data['results']]
+        while res.data['previous']:
+            res = self.client.get(res.data['previous'])
+            back = [r['id'] for r in res.data['results']] + back
+        self.assertEqual(back, expected)
+
+    def test_sort_ties_past_offset_cutoff(self):
+        """Test more ties than DRF's offset cutoff are all paged."""
+        Recipe.objects.bulk_create(
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=5,
+                   price=Decimal('2.50'))
+            for i in range(1100)
+        )
+
+        ids, _ = self.walk_pages({'ordering': 'price', 'page_size': 400})
+
+        expected = list(Recipe.objects.filter(user=self.user)
+                        .order_by('id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        """Test a cursor of another sort is rejected, not a server error."""
+        create_recipe(user=self.user)
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        res = self.client.get(res.data['next'] + '&ordering=price')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
@@ -459,6 +926,23 @@ class ImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_query_budget(self):
+        """Test uploading an image does not load the recipe relations."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            img = Image.new('RGB', (10, 10))
+            img.save(image_file, format='JPEG')
+            image_file.seek(0)
+            with self.assertNumQueries(2):  # fetch recipe + update image
+                res = self.client.post(
+                    url,
+                    {'image': image_file},
+                    format='multipart',
+                )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image."""
         url = image_upload_url(self.recipe.id)
@@ -0,0 +1,161 @@
+"""
+Tests for moving images into the sharded layout.
+"""
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from core.models import ImageBlob, Recipe
+
+from recipe.orphans import find_orphans
+from recipe.serializers import RecipeDetailSerializer
+from recipe.sharding import (
+    iter_batches,
+    move_batch,
+    target_name,
+)
+
+
+class ShardingTests(TestCase):
+    """Test moving images into the sharded layout."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def make_file(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(name.encode())
+        return path
+
+    def create_recipe(self, **params):
+        return Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+            **params,
+        )
+
+    def test_target_name(self):
+        """Test names are sharded by their leading characters."""
+        self.assertEqual(
+            target_name('uploads/recipe/abcdef.jpg', 2),
+            'uploads/recipe/ab/cd/abcdef.jpg',
+        )
+        self.assertEqual(
+            target_name('uploads/recipe/ab/cd/abcdef.jpg', 1),
+            'uploads/recipe/ab/abcdef.jpg',
+        )
+        self.assertEqual(
+            target_name('uploads/recipe/ab/cd/abcdef.jpg', 0),
+            'uploads/recipe/abcdef.jpg',
+        )
+
+    def test_iter_batches(self):
+        """Test only images out of the layout are batched, in order."""
+        for name in ['c1.jpg', 'a1.jpg', 'b1/b1.jpg', 'b1.jpg', 'c1.jpg']:
+            self.create_recipe(image=f'uploads/recipe/{name}')
+
+        batches = list(iter_batches(levels=1, batch_size=2))
+
+        self.assertEqual(batches, [
+            ['uploads/recipe/a1.jpg', 'uploads/recipe/b1.jpg'],
+            ['uploads/recipe/c1.jpg'],   # b1/b1.jpg is in the layout
+        ])
+
+    def test_move_batch(self):
+        """Test images and variants move, the old names go on commit."""
+        old = self.make_file('uploads/recipe/abcd.jpg')
+        old_variant = self.make_file('uploads/recipe/abcd/128.jpg')
+        shared = self.make_file('uploads/recipe/ff/ee/ffee.jpg')
+        variants = {'128': {'jpeg': 'uploads/recipe/abcd/128.jpg',
+                            'webp': 'uploads/recipe/ff/ee/ffee.jpg'}}
+        recipe = self.create_recipe(
+            image='uploads/recipe/abcd.jpg', image_variants=variants,
+        )
+        other = self.create_recipe(image='uploads/recipe/abcd.jpg')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = move_batch(['uploads/recipe/abcd.jpg'], levels=2)
+
+        self.assertEqual(moved, 1)
+        recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'uploads/recipe/ab/cd/abcd.jpg')
+        self.assertEqual(other.image.name, recipe.image.name)
+        self.assertEqual(recipe.image_variants, {'128': {
+            'jpeg': 'uploads/recipe/ab/cd/abcd/128.jpg',
+            'webp': 'uploads/recipe/ff/ee/ffee.jpg',
+        }})
+        with recipe.image.open('rb') as image_file:
+            self.assertEqual(image_file.read(), b'uploads/recipe/abcd.jpg')
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(old_variant))
+        self.assertFalse(os.path.exists(os.path.dirname(old_variant)))
+        self.assertTrue(os.path.exists(shared))
+        self.assertEqual(
+            ImageBlob.objects.get(name=recipe.image.name).refcount, 2,
+        )
+        self.assertFalse(
+            ImageBlob.objects.filter(name='uploads/recipe/abcd.jpg').exists(),
+        )
+
+    def test_new_names_out_of_orphan_grace(self):
+        """Test a collector reading references from before the move
+        doesn't delete the new names."""
+        old = self.make_file('uploads/recipe/abcd.jpg')
+        os.utime(old, (0, 0))
+        self.create_recipe(image='uploads/recipe/abcd.jpg')
+
+        move_batch(['uploads/recipe/abcd.jpg'], levels=2)
+
+        new = os.path.join(self.media_root, 'uploads/recipe/ab/cd/abcd.jpg')
+        self.assertGreater(os.path.getmtime(new), 0)
+        stale_names = ['uploads/recipe/abcd.jpg']
+        self.assertEqual(
+            list(find_orphans(self.media_root, names=stale_names)), [],
+        )
+
+    def test_stale_update_keeps_moved_image(self):
+        """Test a recipe update read before a move doesn't undo it."""
+        self.make_file('uploads/recipe/abcd.jpg')
+        recipe = self.create_recipe(image='uploads/recipe/abcd.jpg')
+        stale = Recipe.objects.get(id=recipe.id)   # read by a PATCH
+
+        with self.captureOnCommitCallbacks(execute=True):
+            move_batch(['uploads/recipe/abcd.jpg'], levels=2)
+        serializer = RecipeDetailSerializer(
+            stale, data={'title': 'Dal'}, partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Dal')
+        self.assertEqual(recipe.image.name, 'uploads/recipe/ab/cd/abcd.jpg')
+
+    def test_missing_file_left_alone(self):
+        """Test rows keep their name when the file can't be found."""
+        recipe = self.create_recipe(image='uploads/recipe/abcd.jpg')
+
+        moved = move_batch(['uploads/recipe/abcd.jpg'], levels=2)
+
+        self.assertEqual(moved, 0)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'uploads/recipe/abcd.jpg')
@@ -0,0 +1,194 @@
+"""
+Tests for the delta sync API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Change,
+    Recipe,
+    Tag,
+)
+
+from recipe.sync import (
+    collapse_changes,
+    current_horizon,
+    prune_changes,
+)
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncApiTests(TransactionTestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to sync."""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TransactionTestCase):
+    """Test syncing changes (the change log needs committed transactions)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor=None):
+        params = {} if cursor is None else {'cursor': cursor}
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_full_sync(self):
+        """Test a sync without cursor returns everything as created."""
+        recipe = create_recipe(user=self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        data = self.sync()
+
+        self.assertEqual(
+            [r['id'] for r in data['recipes']['created']],
+            [recipe.id],
+        )
+        self.assertEqual(data['tags']['created'][0]['name'], 'Vegan')
+        self.assertIn('cursor', data)
+
+    def test_delta_sync(self):
+        """Test created, updated and deleted items since the cursor."""
+        updated = create_recipe(user=self.user, title='Old title')
+        deleted = create_recipe(user=self.user)
+        deleted_id = deleted.id
+        cursor = self.sync()['cursor']
+
+        created = create_recipe(user=self.user, title='New')
+        updated.title = 'New title'
+        updated.save()
+        deleted.delete()
+        temporary = create_recipe(user=self.user)
+        temporary.delete()
+        data = self.sync(cursor)
+
+        recipes = data['recipes']
+        self.assertEqual([r['id'] for r in recipes['created']], [created.id])
+        self.assertEqual(recipes['updated'][0]['title'], 'New title')
+        self.assertEqual(recipes['deleted'], [deleted_id])
+        self.assertGreaterEqual(data['cursor'], cursor)
+
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['recipes']['updated'], [])
+
+    def test_tag_change_marks_recipe_updated(self):
+        """Test attaching a tag reports the recipe as updated."""
+        recipe = create_recipe(user=self.user)
+        cursor = self.sync()['cursor']
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        data = self.sync(cursor)
+
+        self.assertEqual(data['recipes']['updated'][0]['id'], recipe.id)
+        self.assertEqual(data['tags']['created'][0]['name'], 'Dinner')
+
+    def test_sync_limited_to_user(self):
+        """Test changes of other users are not returned."""
+        cursor = self.sync()['cursor']
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(user=other)
+
+        data = self.sync(cursor)
+
+        self.assertEqual(data['recipes']['created'], [])
+
+    def test_changes_past_horizon_held_back(self):
+        """Test a transaction still running is left for the next sync."""
+        cursor = self.sync()['cursor']
+        recipe = create_recipe(user=self.user)
+        # as if logged by a transaction that hasn't committed yet
+        Change.objects.filter(object_id=recipe.id).update(
+            txid=current_horizon() + 1000,
+        )
+
+        data = self.sync(cursor)
+
+        self.assertEqual(data['recipes']['created'], [])
+        self.assertLessEqual(data['cursor'], current_horizon())
+
+    def test_pruned_cursor_needs_full_sync(self):
+        """Test a cursor from before the pruned changes gets a 410."""
+        cursor = self.sync()['cursor']
+        recipe = create_recipe(user=self.user)
+        kept = create_recipe(user=self.user, title='Kept')
+        Change.objects.filter(object_id=recipe.id).update(
+            created_at=timezone.now() - timedelta(days=60),
+        )
+
+        self.assertEqual(prune_changes(timezone.now() - timedelta(days=30)), 1)
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        self.assertEqual(res.data['detail'].code, 'resync_required')
+        data = self.sync()
+        self.assertEqual(
+            {r['id'] for r in data['recipes']['created']},
+            {recipe.id, kept.id},
+        )
+        self.assertEqual(self.sync(data['cursor'])['recipes']['created'], [])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor returns a 400."""
+        res = self.client.get(SYNC_URL, {'cursor': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CollapseChangesTests(SimpleTestCase):
+    """Test reducing the change log to created/updated/deleted ids."""
+
+    def test_collapse(self):
+        """Test only the first and last action of each object count."""
+        changes = [
+            ('recipe', 1, 'INSERT'),
+            ('recipe', 1, 'UPDATE'),
+            ('recipe', 2, 'UPDATE'),
+            ('recipe', 3, 'UPDATE'),
+            ('recipe', 3, 'DELETE'),
+            ('tag', 4, 'INSERT'),
+            ('tag', 4, 'DELETE'),
+        ]
+
+        result = collapse_changes(changes)
+
+        self.assertEqual(result['recipe']['created'], {1})
+        self.assertEqual(result['recipe']['updated'], {2})
+        self.assertEqual(result['recipe']['deleted'], {3})
+        self.assertEqual(result['tag']['deleted'], set())
@@ -0,0 +1,209 @@
+"""
+Tests for validating uploaded images.
+"""
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from PIL import Image, ImageFile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ImageBlob, Recipe
+
+from recipe.uploads import (
+    InvalidImage,
+    fit_size,
+    sanitize_image,
+)
+
+
+def upload_of(size, fmt='JPEG', mode='RGB', name='photo.jpg', **options):
+    """Return an uploaded file holding an image."""
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class SanitizeImageTests(SimpleTestCase):
+    """Test checking and re-encoding uploads."""
+
+    def test_exif_stripped_and_applied(self):
+        """Test the orientation is applied and the EXIF block dropped."""
+        exif = Image.Exif()
+        exif[0x0112] = 6   # orientation: rotated 90 degrees
+        exif[0x010F] = 'Camera maker'
+        upload = upload_of((300, 200), exif=exif.tobytes())
+
+        result = sanitize_image(upload)
+
+        with Image.open(result) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertNotIn('exif', image.info)
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertEqual(result.name, 'photo.jpg')
+
+    def test_png_exif_stripped(self):
+        """Test the eXIf chunk of a PNG is dropped too."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        upload = upload_of((300, 200), fmt='PNG', name='photo.png',
+                           exif=exif.tobytes())
+        self.assertIn(b'Camera maker', upload.read())
+
+        result = sanitize_image(upload)
+
+        self.assertNotIn(b'Camera maker', result.read())
+        result.seek(0)
+        with Image.open(result) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_UPLOADS={'MAX_SIDE': 500})
+    def test_large_image_shrunk(self):
+        """Test images are stored at most MAX_SIDE on the long side."""
+        result = sanitize_image(upload_of((4000, 3000)))
+
+        with Image.open(result) as image:
+            self.assertEqual(image.size, (500, 375))
+
+    @override_settings(IMAGE_UPLOADS={'MAX_PIXELS': 1_000_000})
+    def test_pixel_limit_checked_before_decoding(self):
+        """Test an image over the pixel limit is never decoded."""
+        upload = upload_of((5000, 5000), fmt='PNG', mode='L', name='a.png')
+
+        with patch.object(ImageFile.ImageFile, 'load') as load:
+            with self.assertRaises(InvalidImage):
+                sanitize_image(upload)
+
+        load.assert_not_called()
+
+    @override_settings(IMAGE_UPLOADS={'MAX_BYTES': 100})
+    def test_byte_limit(self):
+        """Test files over the byte limit are rejected."""
+        with self.assertRaises(InvalidImage):
+            sanitize_image(upload_of((100, 100)))
+
+    def test_format_not_accepted(self):
+        """Test images in other formats are rejected."""
+        with self.assertRaises(InvalidImage):
+            sanitize_image(upload_of((10, 10), fmt='GIF', name='a.gif'))
+
+    def test_truncated_image(self):
+        """Test an image cut short is rejected."""
+        upload = upload_of((400, 400), fmt='PNG', name='a.png')
+        upload = SimpleUploadedFile('a.png', upload.read()[:200])
+
+        with self.assertRaises(InvalidImage):
+            sanitize_image(upload)
+
+    def test_png_keeps_format(self):
+        """Test PNGs, with transparency, stay PNGs."""
+        upload = upload_of((10, 10), fmt='PNG', mode='RGBA', name='a.PNG')
+
+        result = sanitize_image(upload)
+
+        with Image.open(result) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(image.mode, 'RGBA')
+        self.assertEqual(result.name, 'a.png')
+
+    def test_fit_size(self):
+        """Test sizes are scaled down to fit, keeping the aspect ratio."""
+        self.assertEqual(fit_size((4000, 1000), 2000), (2000, 500))
+        self.assertEqual(fit_size((100, 50), 2000), (100, 50))
+
+
+class ImageUploadLimitsApiTests(TestCase):
+    """Test the limits of the image upload API."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        self.url = reverse('recipe:recipe-upload-image', args=[self.recipe.id])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    @override_settings(IMAGE_UPLOADS={'MAX_BYTES': 100 * 1024})
+    def test_upload_too_large(self):
+        """Test reading an upload stops once it passes the byte limit."""
+        upload = SimpleUploadedFile('photo.jpg', b'\xff' * 300 * 1024)
+
+        res = self.client.post(self.url, {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(IMAGE_UPLOADS={'MAX_PIXELS': 1_000_000})
+    def test_upload_too_many_pixels(self):
+        """Test images over the pixel limit are rejected."""
+        upload = upload_of((2000, 2000), fmt='PNG', mode='L', name='a.png')
+
+        res = self.client.post(self.url, {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', res.data['image'][0])
+
+    def test_upload_stored_stripped(self):
+        """Test the stored image is the re-encoded one."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        for fmt, name in (('JPEG', 'photo.jpg'), ('PNG', 'photo.png')):
+            upload = upload_of((300, 200), fmt=fmt, name=name,
+                               exif=exif.tobytes())
+
+            res = self.client.post(
+                self.url, {'image': upload}, format='multipart',
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.recipe.refresh_from_db()
+            with self.recipe.image.open('rb') as image_file:
+                self.assertNotIn(b'Camera maker', image_file.read(), fmt)
+
+    def test_duplicate_uploads_stored_once(self):
+        """Test the same image uploaded to two recipes is stored once."""
+        other = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        for recipe in (self.recipe, other):
+            self.client.post(
+                reverse('recipe:recipe-upload-image', args=[recipe.id]),
+                {'image': upload_of((300, 200))},
+                format='multipart',
+            )
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+        self.assertEqual(
+            ImageBlob.objects.get(name=other.image.name).refcount, 2,
+        )
@@ -0,0 +1,146 @@
+"""
+Bounded-memory validation of uploaded recipe images.
+
+Nothing about an upload is trusted before it is checked, and every check
+runs before the expensive step it protects:
+
+1. BoundedUploadHandler spools the request body to a temporary file in
+   64 KB chunks and aborts with a 413 as soon as a file passes MAX_BYTES,
+   so an oversized upload is never held in memory or fully written out.
+2. sanitize_image() opens the spooled file with Pillow, which only parses
+   the header, restricted to the accepted FORMATS. The format and the
+   pixel count from the header are checked before any pixel is decoded,
+   which stops decompression bombs (a few KB of PNG declaring 50k x 50k).
+3. JPEGs are decoded with draft(), letting libjpeg scale by 1/2, 1/4 or
+   1/8 while decoding; other formats are decoded at full size. The image
+   is then shrunk to MAX_SIDE on the long side and rotated per its EXIF
+   orientation.
+4. The result is re-encoded without the EXIF block (GPS position, camera
+   serial numbers, ...) or other metadata except the ICC colour profile,
+   into a spooled file that moves to disk past SPOOL_SIZE and is handed to
+   the storage, which writes it in chunks.
+
+Peak memory per upload, with Pillow's 4 bytes per decoded pixel, is about
+
+    4 * (decoded pixels + MAX_SIDE ** 2) + SPOOL_SIZE + one 64 KB chunk
+
+where decoded pixels is at most MAX_PIXELS, and for JPEGs below
+4 * MAX_SIDE ** 2 thanks to draft(). With the defaults this is under
+100 MB for a 24 megapixel PNG and under 85 MB for any JPEG.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+DEFAULTS = {
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 24_000_000,   # width * height, as declared by the header
+    'MAX_SIDE': 2048,   # px on the long side of the stored original
+    'FORMATS': ('JPEG', 'PNG', 'WEBP'),   # Pillow format names
+    'QUALITY': 90,   # JPEG and WebP re-encoding
+}
+SPOOL_SIZE = 1024 * 1024   # encoded output kept in memory up to this size
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+
+def get_setting(name):
+    """Return an IMAGE_UPLOADS setting, falling back to the default."""
+    return getattr(settings, 'IMAGE_UPLOADS', {}).get(name, DEFAULTS[name])
+
+
+class UploadTooLarge(APIException):
+    """Raised when an uploaded file passes MAX_BYTES."""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'upload_too_large'
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload isn't an acceptable image."""
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Spool uploads to disk, aborting once one passes MAX_BYTES."""
+
+    def receive_data_chunk(self, raw_data, start):
+        """Write a chunk unless it takes the file over the limit."""
+        max_bytes = get_setting('MAX_BYTES')
+        if start + len(raw_data) > max_bytes:
+            self.file.close()   # deletes the partial temporary file
+            raise UploadTooLarge(
+                f'Uploaded file is larger than {max_bytes} bytes.'
+            )
+        return super().receive_data_chunk(raw_data, start)
+
+
+def fit_size(size, max_side):
+    """Return size scaled down to fit max_side, keeping the aspect ratio."""
+    scale = max_side / max(size)
+    if scale >= 1:
+        return size
+    return tuple(max(1, round(side * scale)) for side in size)
+
+
+def sanitize_image(upload):
+    """Return a File with the checked, shrunk and stripped upload.
+
+    Raises InvalidImage if the upload is not an image in an accepted
+    format or is over the byte or pixel limits.
+    """
+    max_bytes = get_setting('MAX_BYTES')
+    if upload.size is not None and upload.size > max_bytes:
+        raise InvalidImage(f'Images are limited to {max_bytes} bytes.')
+
+    formats = get_setting('FORMATS')
+    max_pixels = get_setting('MAX_PIXELS')
+    max_side = get_setting('MAX_SIDE')
+    upload.seek(0)
+    try:
+        with Image.open(upload, formats=formats) as image:
+            # only the header has been read so far
+            width, height = image.size
+            if width * height > max_pixels:
+                raise InvalidImage(
+                    f'Images are limited to {max_pixels} pixels, this one '
+                    f'has {width}x{height}.'
+                )
+            image_format = image.format
+            icc_profile = image.info.get('icc_profile')
+            image.draft(None, fit_size(image.size, max_side))   # JPEG only
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            image = ImageOps.exif_transpose(image)
+    except InvalidImage:
+        raise
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise InvalidImage(
+            f'Upload a valid image ({", ".join(formats)}).'
+        )
+    except (OSError, SyntaxError, ValueError) as exc:   # corrupt data
+        raise InvalidImage(f'The image could not be decoded: {exc}')
+
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = get_setting('QUALITY')
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    # an explicit empty exif, as the PNG encoder otherwise writes the one
+    # still in image.info; none of the original metadata is kept
+    image.save(output, image_format, optimize=True, exif=b'', **options)
+    output.seek(0)
+    stem = os.path.splitext(os.path.basename(upload.name or ''))[0]
+    return File(output, name=f'{stem or "image"}.{EXTENSIONS[image_format]}')
@@ -2,6 +2,12 @@
 Views for the recipe APIs
 """
 
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import gettext as _
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -16,61 +22,257 @@ from rest_framework import (
 )
 
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DecimalField, IntegerField
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication
 from core.models import (
     Recipe,
     Tag,
     Ingredient,
+    RecipeImport,
 )
 
 from recipe import serializers
+from recipe.batch import run_batch
+from recipe.cache import (
+    CachedListMixin,
+    ETagMixin,
+    get_or_build,
+    normalize_params,
+    response_cache_key,
+)
+from recipe.export import (
+    FORMATS,
+    export_recipes,
+)
+from recipe.facets import build_facets
+from recipe.images import schedule_variants
+from recipe.importer import (
+    ImportConflict,
+    ImportFormatError,
+    import_recipes,
+    import_summary,
+)
+from recipe.fast_serializers import (
+    FastListMixin,
+    FastRecipeSerializer,
+)
+from recipe.filters import (
+    assigned_exists,
+    compile_filter,
+    related_exists,
+)
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
+from recipe.search import (
+    search_names,
+    search_recipes,
+)
+from recipe.sync import build_sync
+from recipe.uploads import BoundedUploadHandler
+
+
+PRICE_FIELD = Recipe._meta.get_field('price')
+
+RECIPE_FILTER_PARAMETERS = [   # shared by the list and its facets
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,  # the type is str
+        description='Comma separated list of tag IDs to filter',
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs to filter',
+    ),
+    OpenApiParameter(
+        'q',
+        OpenApiTypes.STR,
+        description='Filter expression, e.g. tag:vegan AND tag:dinner '
+                    'AND NOT ingredient:peanuts (also OR, -term, '
+                    'parentheses and "quoted names")',
+    ),
+    OpenApiParameter(
+        'min_time',
+        OpenApiTypes.INT,
+        description='Minimum time_minutes, inclusive',
+    ),
+    OpenApiParameter(
+        'max_time',
+        OpenApiTypes.INT,
+        description='Maximum time_minutes, inclusive',
+    ),
+    OpenApiParameter(
+        'min_price',
+        OpenApiTypes.DECIMAL,
+        description='Minimum price, inclusive',
+    ),
+    OpenApiParameter(
+        'max_price',
+        OpenApiTypes.DECIMAL,
+        description='Maximum price, inclusive',
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Full-text search over title, description, '
+                    'tags and ingredients, best matches first',
+    ),
+]
+
 
 @extend_schema_view(
-    list=extend_schema(
-        parameters=[
+    list=extend_schema(parameters=RECIPE_FILTER_PARAMETERS),
+    facets=extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS,
+        responses=OpenApiTypes.OBJECT,
+    ),
+    export=extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS + [
             OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,  # the type is str
-                description='Comma separated list of tag IDs to filter',
+                'type',
+                OpenApiTypes.STR, enum=list(FORMATS),
+                description='Export format, ndjson by default. Gzipped '
+                            'when the client accepts gzip.',
             ),
+        ],
+        responses=OpenApiTypes.BINARY,
+    ),
+    bulk_import=extend_schema(
+        parameters=[
             OpenApiParameter(
-                'ingredients',
+                'key',
                 OpenApiTypes.STR,
-                description='Comma separated list of ingredient IDs to filter',
+                description='Key of the import to report on (GET).',
             ),
-        ]
-    )
+        ],
+        request={'multipart/form-data': OpenApiTypes.OBJECT},
+        responses=OpenApiTypes.OBJECT,
+        description='POST a file (NDJSON or CSV as exported, optionally '
+                    'gzipped) with its type and a key; repost with the '
+                    'same key to resume an interrupted import.',
+    ),
+    batch=extend_schema(
+        request=serializers.RecipeBatchSerializer,
+        responses=OpenApiTypes.OBJECT,
+        description='Apply create, update and delete operations in one '
+                    'transaction, returning a result per operation.',
+    ),
 )
 
-class RecipeViewSet(viewsets.ModelViewSet):   # viewsets.ModelViewSet can handel all the CRUD
+class RecipeViewSet(ETagMixin,
+                    CachedListMixin,
+                    FastListMixin,
+                    viewsets.ModelViewSet):   # viewsets.ModelViewSet can handel all the CRUD
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
-    queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    queryset = Recipe.objects.defer('search_vector')   # maintained by the db
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
-
-    def _params_to_ints(self, qs):
+    pagination_class = RecipeCursorPagination
+    cache_list_params = ('tags', 'ingredients')
+    fast_serializer_classes = {'list': FastRecipeSerializer}
+    range_params = {   # query param -> (lookup, field parsing the value)
+        'min_time': ('time_minutes__gte', IntegerField(min_value=0)),
+        'max_time': ('time_minutes__lte', IntegerField(min_value=0)),
+        'min_price': ('price__gte', DecimalField(
+            max_digits=PRICE_FIELD.max_digits,
+            decimal_places=PRICE_FIELD.decimal_places,
+        )),
+        'max_price': ('price__lte', DecimalField(
+            max_digits=PRICE_FIELD.max_digits,
+            decimal_places=PRICE_FIELD.decimal_places,
+        )),
+    }
+
+    def _params_to_ints(self, qs, param):
         """Convert a list of strings to integers."""
-        return [int(str_id) for str_id in qs.split(',')]
+        str_ids = [
+            str_id.strip() for str_id in qs.split(',') if str_id.strip()
+        ]
+        if not str_ids or not all(str_id.isdigit() for str_id in str_ids):
+            raise ValidationError(
+                {param: _('A comma separated list of IDs is required.')}
+            )
+        return [int(str_id) for str_id in str_ids]
 
     def get_queryset(self):  # override and will be called auto in GET request
         """Retrieve recipes for authenticated user."""  # filter performed here
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
         queryset = self.queryset
+        # EXISTS subqueries keep one row per recipe, no join fan-out to undo
         if tags:   # return all recipe if no tags
-            tag_ids = self._params_to_ints(tags)  # convert "1,2,3" to [1,2,3]
-            queryset = queryset.filter(tags__id__in=tag_ids)  # filter tags by id field in tag_ids
+            # convert "1,2,3" to [1,2,3]
+            tag_ids = self._params_to_ints(tags, 'tags')
+            # has any of tag_ids
+            queryset = queryset.filter(related_exists('tags', tag_ids))
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(
+            ingredient_ids = self._params_to_ints(ingredients, 'ingredients')
+            queryset = queryset.filter(
+                related_exists('ingredients', ingredient_ids)
+            )
+        queryset = self._filter_ranges(queryset)
+        expression = self.request.query_params.get('q', '').strip()
+        if expression:
+            queryset = queryset.filter(
+                compile_filter(expression, self.request.user)
+            )
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = search_recipes(queryset, search)
+
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()  # distinct() prevent duplicates
+        ).order_by('-id')
+
+        return self._optimize_queryset(queryset)
+
+    def _filter_ranges(self, queryset):
+        """Apply the min/max time and price query params."""
+        for param, (lookup, field) in self.range_params.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                value = field.run_validation(value)
+            except ValidationError as exc:
+                raise ValidationError({param: exc.detail})
+            queryset = queryset.filter(**{lookup: value})
+
+        return queryset
+
+    def _optimize_queryset(self, queryset):
+        """Load only what the serializer of the current action needs."""
+        if self.action == 'upload_image':
+            # RecipeImageSerializer only touches id and image, no relations
+            return queryset.only('id', 'user_id', 'image')
+
+        if self.action in ('destroy', 'facets', 'export'):
+            return queryset
+
+        if self.action in self.fast_serializer_classes:
+            return queryset   # selects its own columns and relations
+
+        # fetch the tags and ingredients of every recipe in the page with
+        # one query per relation instead of two queries per recipe (N+1)
+        queryset = queryset.prefetch_related('tags', 'ingredients')
+        if self.action == 'list':
+            queryset = queryset.defer('description', 'image')  # not listed
+
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe, or return a 304 if it did not change."""
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):  # override get_serializer_class and will be called auto
         """Return the serializer class for request."""
@@ -111,15 +313,122 @@ class RecipeViewSet(viewsets.ModelViewSet):   # viewsets.ModelViewSet can handel
 # which is used to create new instances, create is called. This method creates a new instance of the model
 # in the database.
 
+    @action(methods=['GET'], detail=False)
+    def facets(self, request):
+        """Return tag, ingredient, time and price counts of the recipes."""
+        return self.conditional_response(self._facets, request)
+
+    def _facets(self, request):
+        params = normalize_params(request.query_params, self.cache_list_params)
+        key = response_cache_key(
+            request.user.id, f'{self.basename}-facets', params,
+        )
+        facets = get_or_build(
+            key,
+            lambda: build_facets(self.filter_queryset(self.get_queryset())),
+        )
+        return Response(facets)
+
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        """Stream the recipes with their tags and ingredients."""
+        fmt = request.query_params.get('type', 'ndjson')
+        if fmt not in FORMATS:
+            raise ValidationError(
+                {'type': _('Export as one of: %s.') % ', '.join(FORMATS)}
+            )
+        content_type, extension = FORMATS[fmt]
+        compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+
+        # rows are read and encoded while the response is being sent
+        response = StreamingHttpResponse(
+            export_recipes(
+                self.filter_queryset(self.get_queryset()),
+                fmt=fmt,
+                compress=compress,
+            ),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{extension}"'
+        )
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    @action(methods=['GET', 'POST'], detail=False, url_path='import')
+    def bulk_import(self, request):
+        """Bulk import recipes from a file, or report on an import."""
+        if request.method == 'GET':
+            state = get_object_or_404(
+                RecipeImport,
+                user=request.user,
+                key=request.query_params.get('key'),
+            )
+            return Response(import_summary(state))
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': _('An import file is required.')})
+        fmt = request.data.get('type', 'ndjson')
+        if fmt not in FORMATS:
+            raise ValidationError(
+                {'type': _('Import one of: %s.') % ', '.join(FORMATS)}
+            )
+        key = request.data.get('key') or None
+        key_length = RecipeImport._meta.get_field('key').max_length
+        if key is not None and len(key) > key_length:
+            raise ValidationError(
+                {'key': _('At most %d characters.') % key_length}
+            )
+
+        try:
+            state, errors = import_recipes(
+                request.user, upload.file, fmt=fmt, key=key,
+            )
+        except ImportFormatError as exc:
+            raise ValidationError({'file': [str(exc)]})
+        except ImportConflict:
+            return Response(
+                {'detail': _('This import is running in another request.')},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        return Response(import_summary(state, errors))
+
+    @action(methods=['POST'], detail=False)
+    def batch(self, request):
+        """Create, update and delete recipes in one request."""
+        serializer = serializers.RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        applied, results = run_batch(
+            request.user,
+            serializer.validated_data['operations'],
+            atomic=serializer.validated_data['mode'] == 'atomic',
+            context=self.get_serializer_context(),
+        )
+        return Response(
+            {'applied': applied, 'results': results},
+            status=status.HTTP_200_OK if applied
+            else status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(methods=['POST'], detail=True, url_path='upload-image')   # add custome action
     def upload_image(self, request, pk=None):
         """Upload an image to recipe."""
+        # spool the body to disk and stop reading past the byte limit, has
+        # to be set before request.data parses it
+        request.upload_handlers = [BoundedUploadHandler(request._request)]
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)  # the default update() in serializer will be called
         # get_serializer method is a utility method provided by the viewset that retrieves
         # an instance of the serializer based on the serializer class returned by get_serializer_class
         if serializer.is_valid():
             serializer.save()   # perform_create wont be call in this case
+            # resized copies are made in the background after the commit
+            schedule_variants(recipe.id)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -136,43 +445,111 @@ class RecipeViewSet(viewsets.ModelViewSet):   # viewsets.ModelViewSet can handel
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes.',
             ),
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include recipe_count, the number of recipes '
+                            'using each item.',
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Prefix or typo tolerant name match, best '
+                            'matches first (use page_size as top-k).',
+            ),
         ]
     )
 )
 
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(ETagMixin,
+                            CachedListMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+
+    def _flag_param(self, name):
+        """Return the 0/1 query param name as a bool."""
+        value = self.request.query_params.get(name, '0')  # 0 is default value
+        if value not in ('0', '1'):
+            raise ValidationError({name: _('Must be 0 or 1.')})
+        return value == '1'
 
     def get_queryset(self):
         # this make the returned data from GET that only belongs to the user
         """Filter queryset to authenticated user."""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))  # 0 is default value
-        )
         queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)   # check the recipe field in tags or ingredents
+        if self._flag_param('assigned_only'):
+            # semi-join: stops at the first recipe using the item, where a
+            # join on recipe would return a row per use for DISTINCT to undo
+            queryset = queryset.filter(assigned_exists(self.recipe_field))
+        if self.action == 'list' and self._flag_param('with_counts'):
+            # every count of the page in the same grouped query
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = search_names(queryset, search)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
 
         # the returned queryset will be passed to serilizer before passing to client as Response object
 
+    def get_serializer_class(self):
+        """Return the serializer class for request."""
+        if self.action == 'list' and self._flag_param('with_counts'):
+            return self.count_serializer_class
+
+        return self.serializer_class
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'   # the Recipe m2m field holding tags
 
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database."""
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            'cursor',
+            OpenApiTypes.INT,
+            description='Cursor returned by the previous sync, '
+                        'omit for a full sync. An expired cursor gets a '
+                        '410, sync again without it.',
+        ),
+    ]
+)
+class SyncView(APIView):
+    """Return the recipes, tags and ingredients changed since a cursor."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Return created, updated and deleted items and the next cursor."""
+        cursor = request.query_params.get('cursor')
+        if cursor is not None:
+            if not cursor.isdigit():
+                raise ValidationError(
+                    {'cursor': _('A valid cursor is required.')}
+                )
+            cursor = int(cursor)
+
+        payload = build_sync(request.user, cursor, {'request': request})
+        return Response(payload)